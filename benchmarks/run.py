@@ -0,0 +1,231 @@
+"""
+Benchmark the utilities against their pandas / numpy / scipy equivalents.
+
+Each benchmark runs over a grid of input sizes, dtypes, NaN densities and
+(for the rolling statistics) window sizes.  The first call for each
+function and dtype is timed separately, since that is where numba
+compiles (or loads from its cache), and the steady-state time is the best
+of several further calls.  Results are written as JSON, so that runs on
+different versions can be compared:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --quick --only rolling_sum ewma
+"""
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import subprocess
+import time
+
+import numba
+import numpy as np
+import pandas as pd
+import scipy
+from numba import njit
+from scipy.stats import rankdata
+
+import utilities.percentile as perc
+from utilities.ewma import ewma
+from utilities.preprocessing import standard_scale, min_max_scale, nan_standard_scale, nan_min_max_scale
+from utilities.rank_data import rank_data
+from utilities.rolling_stats import rolling_sum, rolling_mean
+
+_ = perc  # registers the np.percentile and np.nanpercentile overloads
+
+SIZES = (10000, 1000000)
+QUICK_SIZES = (1000, 100000)
+N_COLUMNS = 10
+DTYPES = ('float64', 'float32')
+NAN_FRACTIONS = (0., 0.1)
+WINDOWS = (10, 1000)
+Q = np.array([1., 25., 50., 75., 99.])
+
+
+@njit(cache=True)
+def _percentile(a, q):
+    return np.percentile(a, q)
+
+
+@njit(cache=True)
+def _nanpercentile(a, q):
+    return np.nanpercentile(a, q)
+
+
+def _standard_scale_reference(X):
+    return (X - np.nanmean(X, axis=0)) / np.nanstd(X, axis=0)
+
+
+def _min_max_scale_reference(X):
+    mins = np.nanmin(X, axis=0)
+    return (X - mins) / (np.nanmax(X, axis=0) - mins)
+
+
+# name, shape of the input ('1d' or '2d'), whether it takes a window, the
+# dtypes and NaN fractions it supports, a function of (data, window) to
+# benchmark, and the name of the baseline with a function of the same
+# arguments
+_BENCHMARKS = [
+    ('rolling_sum', '1d', True, DTYPES, NAN_FRACTIONS,
+     lambda x, w: rolling_sum(x, w),
+     'pandas rolling sum', lambda x, w: pd.Series(x).rolling(w).sum().values),
+    ('rolling_mean', '1d', True, DTYPES, NAN_FRACTIONS,
+     lambda x, w: rolling_mean(x, w),
+     'pandas rolling mean', lambda x, w: pd.Series(x).rolling(w).mean().values),
+    ('ewma', '1d', False, DTYPES, NAN_FRACTIONS,
+     lambda x, w: ewma(x, 0.1, True, False),
+     'pandas ewm mean', lambda x, w: pd.Series(x).ewm(alpha=0.1).mean().values),
+    ('standard_scale', '2d', False, DTYPES, (0.,),
+     lambda X, w: standard_scale(X),
+     'numpy', lambda X, w: (X - X.mean(axis=0)) / X.std(axis=0)),
+    ('nan_standard_scale', '2d', False, DTYPES, NAN_FRACTIONS,
+     lambda X, w: nan_standard_scale(X),
+     'numpy nanmean / nanstd', lambda X, w: _standard_scale_reference(X)),
+    ('min_max_scale', '2d', False, DTYPES, (0.,),
+     lambda X, w: min_max_scale(X),
+     'numpy', lambda X, w: (X - X.min(axis=0)) / (X.max(axis=0) - X.min(axis=0))),
+    ('nan_min_max_scale', '2d', False, DTYPES, NAN_FRACTIONS,
+     lambda X, w: nan_min_max_scale(X),
+     'numpy nanmin / nanmax', lambda X, w: _min_max_scale_reference(X)),
+    ('rank_data', '2d', False, DTYPES + ('int64',), (0.,),
+     lambda X, w: rank_data(X),
+     'scipy rankdata', lambda X, w: rankdata(X, axis=0)),
+    ('np.percentile', '1d', False, DTYPES + ('int64',), (0.,),
+     lambda x, w: _percentile(x, Q),
+     'numpy percentile', lambda x, w: np.percentile(x, Q)),
+    ('np.nanpercentile', '1d', False, DTYPES, NAN_FRACTIONS,
+     lambda x, w: _nanpercentile(x, Q),
+     'numpy nanpercentile', lambda x, w: np.nanpercentile(x, Q)),
+]
+
+BENCHMARKS = tuple(b[0] for b in _BENCHMARKS)
+
+
+def _make_data(shape, n, dtype, nan_fraction, seed=0):
+    rng = np.random.RandomState(seed)
+    size = n if shape == '1d' else (n // N_COLUMNS, N_COLUMNS)
+
+    if dtype == 'int64':
+        return rng.randint(0, n, size=size)
+
+    data = rng.standard_normal(size).astype(dtype)
+    if nan_fraction > 0:
+        data[rng.rand(*data.shape) < nan_fraction] = np.nan
+
+    return data
+
+
+def _best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(only=None, sizes=SIZES, repeat=5, verbose=False):
+    """
+    Run the benchmarks (all of them, or those named in only), returning a
+    list with a dict of parameters and timings for each case.  The
+    compile_time is the time of the first call for a function and dtype
+    less the steady-state time, and is None for later cases, which reuse
+    the compiled code.
+    """
+    if only is not None:
+        unknown = set(only) - set(BENCHMARKS)
+        if unknown:
+            raise ValueError('unknown benchmarks: ' + ', '.join(sorted(unknown)))
+
+    if repeat < 1:
+        raise ValueError('repeat must be at least 1')
+
+    results = []
+
+    for name, shape, windowed, dtypes, nan_fractions, func, baseline, baseline_func in _BENCHMARKS:
+        if only is not None and name not in only:
+            continue
+
+        windows = WINDOWS if windowed else (None,)
+        compiled = set()
+
+        for dtype, n, nan_fraction, window in itertools.product(dtypes, sizes, nan_fractions, windows):
+            data = _make_data(shape, n, dtype, nan_fraction)
+
+            first_call = None
+            if dtype not in compiled:
+                start = time.perf_counter()
+                func(data, window)
+                first_call = time.perf_counter() - start
+                compiled.add(dtype)
+
+            seconds = _best_time(lambda: func(data, window), repeat)
+            baseline_seconds = _best_time(lambda: baseline_func(data, window), repeat)
+
+            result = {
+                'benchmark': name,
+                'shape': list(data.shape),
+                'dtype': dtype,
+                'nan_fraction': nan_fraction,
+                'window': window,
+                'compile_time': None if first_call is None else max(first_call - seconds, 0.),
+                'time': seconds,
+                'baseline': baseline,
+                'baseline_time': baseline_seconds,
+                'speedup': baseline_seconds / seconds if seconds > 0 else None,
+            }
+            results.append(result)
+
+            if verbose:
+                print('{:<20}{:>10}{:>9}{:>6}{:>7}{:12.6f}s{:12.6f}s{:9.2f}x'.format(
+                    name, n, dtype, nan_fraction, '' if window is None else window,
+                    seconds, baseline_seconds, result['speedup'] or np.nan))
+
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default='bench.json', help='JSON file to write the results to')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='benchmarks to run (default all)')
+    parser.add_argument('--quick', action='store_true', help='use smaller inputs')
+    parser.add_argument('--repeat', type=int, default=5, help='calls timed for each case, keeping the best')
+    parser.add_argument('--quiet', action='store_true')
+    options = parser.parse_args(args)
+
+    sizes = QUICK_SIZES if options.quick else SIZES
+    results = run(options.only, sizes, options.repeat, verbose=not options.quiet)
+
+    report = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'n_threads': numba.get_num_threads(),
+        'versions': {
+            'python': platform.python_version(),
+            'numba': numba.__version__,
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'scipy': scipy.__version__,
+        },
+        'results': results,
+    }
+
+    with open(options.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    return report
+
+
+if __name__ == '__main__':
+    main()
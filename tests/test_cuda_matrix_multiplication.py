@@ -3,6 +3,7 @@ import numpy as np
 from numba import cuda
 import numba
 from timeit import default_timer as timer
+from pytest import raises
 
 
 def _test_kernel(kernel):
@@ -56,6 +57,196 @@ def test_optimised_kernel():
     # substantially slower than naive
 
 
+# small enough to run under the CUDA simulator (NUMBA_ENABLE_CUDASIM=1)
+GEMM_SHAPES = [(1, 1, 1), (5, 3, 7), (33, 40, 31), (64, 32, 65)]
+
+
+def test_gemm_shapes_and_dtypes():
+    random_state = np.random.RandomState(0)
+
+    for m, k, n in GEMM_SHAPES:
+        for dtype in np.float32, np.float64:
+            A = random_state.rand(m, k).astype(dtype)
+            B = random_state.rand(k, n).astype(dtype)
+
+            output = kernels.gemm(A, B)
+            assert output.dtype == dtype
+            assert output.shape == (m, n)
+            assert np.allclose(A @ B, output, rtol=1e-5 if dtype == np.float32 else 1e-12)
+
+
+def test_gemm_mixed_dtypes_and_strided_input():
+    A = np.random.RandomState(1).rand(20, 18)
+    B = np.random.RandomState(2).rand(9, 11).astype(np.float32)
+
+    output = kernels.gemm(A[::2, ::2], B)
+    assert output.dtype == np.float64
+    assert np.allclose(A[::2, ::2] @ B, output)
+
+
+def test_gemm_invalid_shapes():
+    with raises(ValueError):
+        _ = kernels.gemm(np.ones((3, 4)), np.ones((3, 4)))
+
+
+def test_matmul_panels_and_streams(monkeypatch):
+    monkeypatch.setattr(kernels, 'PANEL_ROWS', 16)
+    random_state = np.random.RandomState(3)
+    A = random_state.rand(50, 20).astype(np.float32)
+    B = random_state.rand(20, 9).astype(np.float32)
+
+    output = kernels.matmul(A, B)
+    assert output.dtype == np.float32
+    assert np.allclose(A @ B, output, rtol=1e-5)
+
+    # a second call reuses the pooled buffers, and writes into out
+    out = np.empty((50, 9), dtype=np.float32)
+    result = kernels.matmul(A, B, out=out, stream=cuda.stream())
+    assert result is out
+    assert np.array_equal(output, out)
+
+
+def test_buffer_pool_capacity_and_limit():
+    pool = kernels._BufferPool(max_bytes=2 * 1024 * 8)
+
+    # shapes of similar sizes share a buffer, with a power of two capacity
+    buffer, view = pool.acquire('pinned', (30, 30), np.float64)
+    assert buffer.shape == (1024,) and view.shape == (30, 30)
+    pool.release('pinned', buffer)
+
+    reused, view = pool.acquire('pinned', (1000,), np.float64)
+    assert reused is buffer and view.shape == (1000,)
+    pool.release('pinned', reused)
+
+    # beyond max_bytes, the least recently released buffers are freed
+    first, _ = pool.acquire('device', (512, 2), np.float64)
+    second, _ = pool.acquire('device', (1024,), np.float64)
+    pool.release('device', first)
+    pool.release('device', second)
+
+    assert [entry[3] for entry in pool._free] == [first, second]
+    assert pool._free_bytes <= pool.max_bytes
+
+
+def test_matmul_batched():
+    random_state = np.random.RandomState(4)
+    A = random_state.rand(6, 5, 7)
+    B = random_state.rand(6, 7, 3)
+
+    assert np.allclose(A @ B, kernels.matmul(A, B))
+
+
+class _RecordLaunches:
+
+    def __init__(self, kernel, launches):
+        self._kernel = kernel
+        self._launches = launches
+
+    def __getitem__(self, config):
+        self._launches.append(config[0])
+        return self._kernel[config]
+
+
+def test_matmul_batched_chunks(monkeypatch):
+    # 4 matrices a chunk, the last chunk partly full, each one launch
+    monkeypatch.setattr(kernels, 'BATCH_ELEMENTS', 4 * (40 * 33 + 33 * 35 + 40 * 35))
+    launches = []
+    batched = kernels._BATCHED_TILED_KERNELS[np.dtype(np.float32)]
+    monkeypatch.setitem(kernels._BATCHED_TILED_KERNELS, np.dtype(np.float32),
+                        _RecordLaunches(batched, launches))
+
+    random_state = np.random.RandomState(8)
+    A = random_state.rand(10, 40, 33).astype(np.float32)
+    B = random_state.rand(10, 33, 35).astype(np.float32)
+
+    output = kernels.matmul(A, B)
+    assert np.allclose(A @ B, output, rtol=1e-5)
+    assert [griddim[2] for griddim in launches] == [4, 4, 2]
+
+
+def test_matmul_cpu_fallback(monkeypatch):
+    monkeypatch.setattr(kernels.cuda, 'is_available', lambda: False)
+    random_state = np.random.RandomState(5)
+
+    A = random_state.rand(40, 30)
+    B = random_state.rand(30, 20)
+    assert np.allclose(A @ B, kernels.matmul(A, B))
+
+    A = random_state.rand(10, 4, 4).astype(np.float32)
+    B = random_state.rand(10, 4, 4).astype(np.float32)
+    output = kernels.matmul(A, B)
+    assert output.dtype == np.float32
+    assert np.allclose(A @ B, output, rtol=1e-5)
+
+
+def test_matmul_empty_and_invalid():
+    assert np.array_equal(kernels.matmul(np.ones((3, 0)), np.ones((0, 2))), np.zeros((3, 2)))
+    assert kernels.matmul(np.ones((0, 3)), np.ones((3, 2))).shape == (0, 2)
+
+    with raises(ValueError):
+        _ = kernels.matmul(np.ones((3, 4)), np.ones((3, 4)))
+
+    with raises(ValueError):
+        _ = kernels.matmul(np.ones((2, 3, 4)), np.ones((3, 4, 2)))
+
+    with raises(ValueError):
+        _ = kernels.matmul(np.ones((3, 4)), np.ones((4, 2)), out=np.empty((3, 2), dtype=np.float32))
+
+    with raises(ValueError):
+        _ = kernels.matmul(np.ones((3, 4)), np.ones((4, 2)), backend='tpu')
+
+
+def test_cpu_matrix_mult_blocks():
+    random_state = np.random.RandomState(6)
+
+    # shapes either side of the block sizes
+    for m, k, n in (1, 1, 1), (65, 129, 513), (130, 300, 20), (3, 700, 1100):
+        A = random_state.rand(m, k)
+        B = random_state.rand(k, n)
+        out = np.empty((m, n))
+        kernels.cpu_matrix_mult(A, B, out)
+        assert np.allclose(A @ B, out)
+        assert np.allclose(A @ B, kernels.matmul(A, B, backend='cpu'))
+
+
+def test_matmul_cpu_dispatch(monkeypatch):
+    calls = []
+    batched = kernels.batched_matrix_mult
+
+    def record(A, B, out):
+        calls.append(A.shape)
+        batched(A, B, out)
+
+    monkeypatch.setattr(kernels, 'batched_matrix_mult', record)
+    random_state = np.random.RandomState(9)
+
+    # stacks of tiny matrices use the size-specialised kernel, others BLAS
+    for shape in (10, 5, 5), (10, 7, 7), (10, 8, 8), (10, 40, 40):
+        A = random_state.rand(*shape)
+        B = random_state.rand(*shape)
+        assert np.allclose(A @ B, kernels.matmul(A, B, backend='cpu'))
+
+    assert calls == [(10, 5, 5), (10, 7, 7)]
+
+
+def test_batched_matrix_mult():
+    random_state = np.random.RandomState(7)
+
+    for size in 1, 3, 4, 16:
+        A = random_state.rand(1000, size, size)
+        B = random_state.rand(1000, size, size)
+        out = np.empty((1000, size, size))
+        kernels.batched_matrix_mult(A, B, out)
+        assert np.allclose(A @ B, out)
+        assert np.allclose(A @ B, kernels.matmul(A, B, backend='cpu'))
+
+    A = random_state.rand(20, 3, 5).astype(np.float32)
+    B = random_state.rand(20, 5, 2).astype(np.float32)
+    out = np.empty((20, 3, 2), dtype=np.float32)
+    kernels.batched_matrix_mult(A, B, out)
+    assert np.allclose(A @ B, out, rtol=1e-5)
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main()
@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
 
-from utilities.ewma import ewma
+from pytest import raises
+
+from utilities.ewma import ewma, ewma_2d, ewma_times, EwmaAccumulator, ewmvar, ewmstd, ewmcov, ewmcorr, ewmcov_matrix, ewmcorr_matrix
 
 
 def sample_data_series():
@@ -11,6 +13,15 @@ def sample_data_series():
     return pd.Series(data)
 
 
+def sample_data_frame():
+    data = np.random.RandomState(0).randn(60, 5)
+    data[3:5, 0] = np.nan
+    data[10, 2] = np.nan
+    data[0, 4] = np.nan
+    data[30:40, 4] = np.nan
+    return pd.DataFrame(data)
+
+
 def test_ewma_adjust_and_ignore_na():
     series = sample_data_series()
     alpha = 0.1
@@ -51,6 +62,178 @@ def test_ewma():
     assert np.allclose(expected, output)
 
 
+def test_ewma_times():
+    series = sample_data_series()
+    gaps = np.random.RandomState(1).randint(1, 10 ** 10, len(series))
+    times = pd.DatetimeIndex(np.cumsum(gaps).astype('datetime64[ns]'))
+    halflife = pd.Timedelta(seconds=5)
+
+    for adjust in True, False:
+        for ignore_na in True, False:
+            expected = series.ewm(halflife=halflife, times=times, adjust=adjust, ignore_na=ignore_na).mean()
+            output = ewma_times(series.values, times.asi8, halflife.value, adjust, ignore_na)
+            assert np.allclose(expected, output)
+
+
+def test_ewma_times_regular_spacing_matches_ewma():
+    series = sample_data_series()
+    times = np.arange(len(series), dtype=np.int64) * 1000
+
+    output = ewma_times(series.values, times, 1000., True, False)
+    assert np.allclose(output, ewma(series.values, 0.5, True, False))
+
+
+def test_ewma_times_invalid_arguments():
+    data = sample_data_series().values
+    times = np.arange(len(data), dtype=np.int64)
+
+    with raises(ValueError):
+        _ = ewma_times(data, times[1:], 1., True, False)
+
+    with raises(ValueError):
+        _ = ewma_times(data, times, 0., True, False)
+
+
+def test_ewma_accumulator_matches_ewma():
+    data = sample_data_series().values.copy()
+    data[0] = np.nan
+    data[20:25] = np.nan
+    chunk_ends = [1, 2, 4, 5, 19, 23, 40, 50]
+
+    for adjust in True, False:
+        for ignore_na in True, False:
+            expected = ewma(data, 0.3, adjust, ignore_na)
+
+            accumulator = EwmaAccumulator(0.3, adjust, ignore_na)
+            start = 0
+            chunks = []
+            for end in chunk_ends:
+                chunks.append(accumulator.update(data[start:end]))
+                start = end
+
+            assert np.array_equal(np.concatenate(chunks), expected, equal_nan=True)
+
+
+def test_ewma_accumulator_push():
+    data = sample_data_series().values
+    expected = ewma(data, 0.2, True, False)
+
+    accumulator = EwmaAccumulator(0.2, True, False)
+    output = np.array([accumulator.push(v) for v in data])
+    assert np.array_equal(output, expected, equal_nan=True)
+
+
+def test_ewma_2d_per_column_alpha():
+    df = sample_data_frame()
+    alphas = np.array([0.1, 0.2, 0.6, 0.9, 0.05])
+
+    for adjust in True, False:
+        for ignore_na in True, False:
+            output = ewma_2d(df.values, alphas, adjust, ignore_na)
+            for j, alpha in enumerate(alphas):
+                expected = df[j].ewm(alpha=alpha, adjust=adjust, ignore_na=ignore_na).mean()
+                assert np.allclose(expected, output[:, j], equal_nan=True)
+
+
+def test_ewma_2d_scalar_alpha_matches_ewma():
+    df = sample_data_frame()
+    alpha = 0.3
+
+    output = ewma_2d(df.values, alpha, True, False)
+    for j in range(df.shape[1]):
+        assert np.array_equal(output[:, j], ewma(df[j].values, alpha, True, False), equal_nan=True)
+
+
+def test_ewma_2d_rows():
+    df = sample_data_frame()
+    alpha = 0.1
+
+    expected = df.ewm(alpha=alpha, adjust=True, ignore_na=True).mean().values
+    output = ewma_2d(df.values.T, alpha, True, True, axis=1)
+    assert np.allclose(expected.T, output, equal_nan=True)
+
+
+def test_ewma_2d_invalid_arguments():
+    data = sample_data_frame().values
+
+    with raises(ValueError):
+        _ = ewma_2d(data, np.array([0.1, 0.2]), True, True)
+
+    with raises(ValueError):
+        _ = ewma_2d(data, 0.1, True, True, axis=2)
+
+    with raises(ValueError):
+        _ = ewma_2d(data[:, 0], 0.1, True, True)
+
+
+def _ewm_settings():
+    for alpha in 0.1, 0.7:
+        for adjust in True, False:
+            for ignore_na in True, False:
+                yield alpha, adjust, ignore_na
+
+
+def test_ewmvar_and_ewmstd():
+    df = sample_data_frame()
+
+    for alpha, adjust, ignore_na in _ewm_settings():
+        for j in 0, 4:
+            ewm = df[j].ewm(alpha=alpha, adjust=adjust, ignore_na=ignore_na)
+            for bias in True, False:
+                data = df[j].values
+                assert np.allclose(ewm.var(bias=bias), ewmvar(data, alpha, adjust, ignore_na, bias), equal_nan=True)
+                assert np.allclose(ewm.std(bias=bias), ewmstd(data, alpha, adjust, ignore_na, bias), equal_nan=True)
+
+
+def test_ewmcov_and_ewmcorr():
+    df = sample_data_frame()
+    x = df[0]
+    y = df[4]
+
+    for alpha, adjust, ignore_na in _ewm_settings():
+        ewm = x.ewm(alpha=alpha, adjust=adjust, ignore_na=ignore_na)
+        for bias in True, False:
+            expected = ewm.cov(y, bias=bias)
+            assert np.allclose(expected, ewmcov(x.values, y.values, alpha, adjust, ignore_na, bias), equal_nan=True)
+
+        expected = ewm.corr(y)
+        assert np.allclose(expected, ewmcorr(x.values, y.values, alpha, adjust, ignore_na), equal_nan=True)
+
+
+def test_ewmvar_constant_series():
+    data = np.full(20, 3.)
+
+    output = ewmvar(data, 0.3, True, False)
+    assert np.isnan(output[0])
+    assert np.all(output[1:] == 0)
+
+
+def test_ewmcov_matrix():
+    df = sample_data_frame()
+    alpha = 0.2
+    n, k = df.shape
+
+    expected = df.ewm(alpha=alpha, adjust=True, ignore_na=False).cov().values.reshape(n, k, k)
+    output = ewmcov_matrix(df.values, alpha, True, False)
+    assert np.allclose(expected, output, equal_nan=True)
+
+    latest = ewmcov_matrix(df.values, alpha, True, False, latest=True)
+    assert np.array_equal(latest, output[-1], equal_nan=True)
+
+
+def test_ewmcorr_matrix():
+    df = sample_data_frame()
+    alpha = 0.2
+    n, k = df.shape
+
+    expected = df.ewm(alpha=alpha, adjust=False, ignore_na=True).corr().values.reshape(n, k, k)
+    output = ewmcorr_matrix(df.values, alpha, False, True)
+    assert np.allclose(expected, output, equal_nan=True)
+
+    with raises(ValueError):
+        _ = ewmcorr_matrix(df[0].values, alpha, False, True)
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main()
@@ -1,10 +1,11 @@
 
 import numpy as np
-from numba import njit
+from numba import errors, njit
 from numpy.testing import assert_allclose
 from pytest import approx, raises
 
 import utilities.percentile as perc
+from utilities.percentile import weighted_percentile
 
 _ = perc  # to prevent it appearing to be an unused import
 
@@ -19,6 +20,38 @@ def np_nanpercentile_jit(x, q):
     return np.nanpercentile(x, q)
 
 
+def np_percentile_method_jit(method):
+    return njit(lambda x, q: np.percentile(x, q, method=method))
+
+
+def np_nanpercentile_method_jit(method):
+    return njit(lambda x, q: np.nanpercentile(x, q, method=method))
+
+
+def np_percentile_method_axis_jit(method):
+    return njit(lambda x, q: np.percentile(x, q, axis=0, method=method))
+
+
+@njit
+def np_percentile_axis_jit(x, q, axis):
+    return np.percentile(x, q, axis=axis)
+
+
+@njit
+def np_nanpercentile_axis_jit(x, q, axis):
+    return np.nanpercentile(x, q, axis=axis)
+
+
+@njit
+def np_percentile_keepdims_jit(x, q, axis):
+    return np.percentile(x, q, axis=axis, keepdims=True)
+
+
+@njit
+def np_nanpercentile_keepdims_jit(x, q, axis):
+    return np.nanpercentile(x, q, axis=axis, keepdims=True)
+
+
 def test_scalar_q():
 
     arr = np.array([1, 4, 3, 3.3, 6, 5, 2.2])
@@ -85,6 +118,237 @@ def test_multi_dimensional_array():
     assert_allclose(output, expected)
 
 
+def test_many_q_unsorted():
+
+    arr = np.random.RandomState(0).randn(10001)
+    q = np.array([99.9, 0, 50, 12.5, 50, 100, 0.01, 75, 25, 1])
+
+    output = np_percentile_jit(arr, q)
+    expected = np.percentile(arr, q)
+    assert_allclose(output, expected)
+
+
+def test_many_ties():
+
+    arr = np.random.RandomState(1).randint(0, 5, size=5000).astype(float)
+    q = np.linspace(0, 100, 37)
+
+    output = np_percentile_jit(arr, q)
+    expected = np.percentile(arr, q)
+    assert_allclose(output, expected)
+
+
+def test_sorted_and_reversed_input():
+
+    arr = np.arange(2000).astype(float)
+    q = np.array([1, 33.3, 50, 66.6, 99])
+
+    assert_allclose(np_percentile_jit(arr, q), np.percentile(arr, q))
+    assert_allclose(np_percentile_jit(arr[::-1], q), np.percentile(arr[::-1], q))
+
+
+def test_integer_array():
+
+    arr = np.random.RandomState(2).randint(-100, 100, size=999)
+    q = np.array([0, 10, 50, 77.7, 100])
+
+    output = np_percentile_jit(arr, q)
+    expected = np.percentile(arr, q)
+    assert_allclose(output, expected)
+
+
+def test_input_not_modified():
+
+    arr = np.random.RandomState(3).randn(100)
+    original = arr.copy()
+
+    _ = np_percentile_jit(arr, 50)
+    _ = np_nanpercentile_jit(arr, 50)
+    assert np.array_equal(arr, original)
+
+
+def _check_axis(jit_func, numpy_func, arr, keepdims=False):
+
+    cases = (
+        (0, 30.5),
+        (1, (10, 50, 90)),
+        (-1, 30.5),
+        ((0, 2), np.array([0, 12.5, 100])),
+        ((2, 1), 30.5),
+        ((0, 1, 2), np.array([0, 12.5, 100])),
+    )
+
+    for axis, q in cases:
+        output = jit_func(arr, q, axis)
+        expected = numpy_func(arr, q, axis=axis, keepdims=keepdims)
+        assert np.shape(output) == np.shape(expected)
+        assert_allclose(output, expected)
+
+
+def test_axis():
+
+    arr = np.random.RandomState(4).randn(4, 5, 6)
+    _check_axis(np_percentile_axis_jit, np.percentile, arr)
+
+
+def test_axis_keepdims():
+
+    arr = np.random.RandomState(5).randn(4, 5, 6)
+    _check_axis(np_percentile_keepdims_jit, np.percentile, arr, keepdims=True)
+
+
+def test_axis_strided_view():
+
+    arr = np.random.RandomState(6).randn(8, 10, 12)[1::2, ::3, ::-1]
+    _check_axis(np_percentile_axis_jit, np.percentile, arr)
+
+
+def test_axis_contains_nan():
+
+    arr = np.random.RandomState(7).randn(3, 4)
+    arr[1, 2] = np.nan
+    q = 50
+
+    output = np_percentile_axis_jit(arr, q, 0)
+    expected = np.percentile(arr, q, axis=0)
+    assert_allclose(output, expected)
+    assert np.isnan(output[2])
+
+
+def test_axis_reduces_to_scalar():
+
+    arr = np.array([1, 4, 3, 3.3, 6, 5, 2.2])
+    q = 2.2
+
+    output = np_percentile_axis_jit(arr, q, 0)
+    expected = np.percentile(arr, q, axis=0)
+    assert output == approx(expected)
+
+
+def test_axis_out_of_bounds():
+
+    arr = np.random.RandomState(8).randn(3, 4)
+
+    with raises(ValueError):
+        _ = np_percentile_axis_jit(arr, 50, 2)
+
+    with raises(ValueError):
+        _ = np_percentile_axis_jit(arr, 50, (0, 0))
+
+    with raises(ValueError):
+        _ = np_percentile_axis_jit(arr, np.array([50, 101]), 0)
+
+
+def test_methods():
+
+    q = np.array([0, 1, 12.5, 25, 37.5, 50, 62.5, 87.5, 99, 100])
+
+    for method in 'linear', 'lower', 'higher', 'nearest', 'midpoint':
+        func = np_percentile_method_jit(method)
+        for n in 1, 4, 5, 101:
+            arr = np.random.RandomState(n).randn(n)
+            output = func(arr, q)
+            expected = np.percentile(arr, q, method=method)
+            assert_allclose(output, expected)
+
+    # whole-number indices, which are sensitive to rounding
+    arr = np.arange(101.)
+    q = np.arange(101.)
+
+    for method in 'lower', 'higher', 'nearest', 'midpoint':
+        output = np_percentile_method_jit(method)(arr, q)
+        assert_allclose(output, np.percentile(arr, q, method=method))
+
+        output = np_percentile_method_axis_jit(method)(arr.reshape(101, 1), q)
+        assert_allclose(output, np.percentile(arr.reshape(101, 1), q, axis=0, method=method))
+
+
+def test_method_with_axis():
+
+    arr = np.random.RandomState(11).randn(5, 6)
+    q = (12.5, 50, 87.5)
+
+    output = njit(lambda x, q: np.percentile(x, q, axis=1, method='nearest'))(arr, q)
+    expected = np.percentile(arr, q, axis=1, method='nearest')
+    assert_allclose(output, expected)
+
+
+def test_positional_arguments():
+
+    arr = np.random.RandomState(16).randn(5, 6)
+    arr[1, 2] = np.nan
+
+    # a, q, axis, out, overwrite_input, method, keepdims, as numpy
+    output = njit(lambda x: np.percentile(x, 50., 0, None, False, 'lower', True))(arr)
+    expected = np.percentile(arr, 50., 0, None, False, 'lower', True)
+    assert_allclose(output, expected)
+
+    output = njit(lambda x: np.nanpercentile(x, 50., 1, None, True, 'higher'))(arr)
+    expected = np.nanpercentile(arr, 50., 1, None, False, 'higher')
+    assert_allclose(output, expected)
+
+    with raises(errors.TypingError):
+        _ = njit(lambda x, out: np.percentile(x, 50., 0, out))(arr, np.empty(6))
+
+
+def test_unknown_method():
+
+    arr = np.array([1, 4, 3, 3.3, 6, 5, 2.2])
+
+    with raises(ValueError):
+        _ = np_percentile_method_jit('cubic')(arr, 50)
+
+
+def test_weighted_percentile():
+
+    arr = np.random.RandomState(12).randn(1001)
+    weights = np.random.RandomState(13).rand(1001)
+    q = np.array([0, 1, 12.5, 50, 99, 100])
+
+    output = weighted_percentile(arr, weights, q)
+    expected = np.percentile(arr, q, weights=weights, method='inverted_cdf')
+    assert_allclose(output, expected)
+
+    output = weighted_percentile(arr, weights, 30)
+    expected = np.percentile(arr, 30, weights=weights, method='inverted_cdf')
+    assert output == approx(expected)
+
+    # zero weights, including on the lowest values
+    arr = np.array([3, 1, 0, 4, 1, 2, 3, 4, 4])
+    weights = np.array([0, 2, 0, 1, 2, 2, 1, 1, 2])
+    q = np.array([0, 10, 25, 50, 75, 100])
+
+    output = weighted_percentile(arr, weights, q)
+    expected = np.percentile(arr, q, weights=weights, method='inverted_cdf')
+    assert_allclose(output, expected)
+
+
+def test_weighted_percentile_unit_weights():
+
+    arr = np.random.RandomState(14).randn(11)
+    q = (10, 50, 90)
+
+    output = weighted_percentile(arr, np.ones(11), q)
+    expected = np.percentile(arr, q, method='inverted_cdf')
+    assert_allclose(output, expected)
+
+
+def test_weighted_percentile_invalid():
+
+    arr = np.array([1, 4, 3, 3.3, 6, 5, 2.2])
+
+    with raises(ValueError):
+        _ = weighted_percentile(arr, -np.ones(7), 50)
+
+    with raises(ValueError):
+        _ = weighted_percentile(arr, np.ones(6), 50)
+
+    with raises(ValueError):
+        _ = weighted_percentile(arr, np.ones(7), 101)
+
+    arr[2] = np.nan
+    assert np.isnan(weighted_percentile(arr, np.ones(7), 50))
+
 ######### nan percentile
 
 def test_nanpercentile_scalar_q():
@@ -159,6 +423,40 @@ def test_nanpercentile_arr_all_but_one_nan():
     assert_allclose(output, expected)
 
 
+def test_nanpercentile_axis():
+
+    arr = np.random.RandomState(9).randn(4, 5, 6)
+    arr[1, 2, 3] = np.nan
+    arr[2, :, 1] = np.nan
+    _check_axis(np_nanpercentile_axis_jit, np.nanpercentile, arr)
+
+
+def test_nanpercentile_axis_keepdims():
+
+    arr = np.random.RandomState(10).randn(4, 5, 6)
+    arr[0, 0, :] = np.nan
+    _check_axis(np_nanpercentile_keepdims_jit, np.nanpercentile, arr, keepdims=True)
+
+
+def test_nanpercentile_methods():
+
+    arr = np.random.RandomState(15).randn(21)
+    arr[[3, 9]] = np.nan
+    q = np.array([0, 12.5, 50, 87.5, 100])
+
+    for method in 'lower', 'higher', 'nearest', 'midpoint':
+        output = np_nanpercentile_method_jit(method)(arr, q)
+        expected = np.nanpercentile(arr, q, method=method)
+        assert_allclose(output, expected)
+
+    arr = np.concatenate((np.arange(101.), [np.nan, np.nan]))
+    q = np.arange(101.)
+
+    for method in 'lower', 'higher', 'nearest', 'midpoint':
+        output = np_nanpercentile_method_jit(method)(arr, q)
+        assert_allclose(output, np.nanpercentile(arr, q, method=method))
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main()
@@ -1,9 +1,14 @@
+import os
+import tempfile
 import numpy as np
 import pandas as pd
 from unittest import TestCase
-from sklearn.preprocessing import StandardScaler, MinMaxScaler
+from sklearn.preprocessing import StandardScaler, MinMaxScaler, RobustScaler, QuantileTransformer
+from scipy.stats import rankdata
 from sklearn.datasets import load_iris
-from utilities.preprocessing import standard_scale, min_max_scale
+from utilities.preprocessing import standard_scale, min_max_scale, standard_scale_fit, min_max_scale_fit, scale_transform
+from utilities.preprocessing import standard_scale_fit_chunked, min_max_scale_fit_chunked, scale_transform_chunked, row_blocks
+from utilities.preprocessing import nan_standard_scale, nan_min_max_scale, robust_scale, robust_scale_fit, quantile_transform
 from pytest import raises
 
 
@@ -17,12 +22,76 @@ class RollingStatsTests:
         output = self._func(predictors)
         assert np.allclose(expected, output)
 
+    def test_fit_then_transform_new_data(self):
+        predictors = load_iris().data
+        train = predictors[::2]
+        batch = predictors[1::2]
+
+        expected = self._scaler().fit(train).transform(batch)
+        loc, scale = self._fit(train)
+        output = scale_transform(batch, loc, scale)
+        assert np.allclose(expected, output)
+
+    def test_transform_into_out(self):
+        predictors = load_iris().data
+        expected = self._func(predictors)
+        loc, scale = self._fit(predictors)
+
+        out = np.empty_like(predictors)
+        output = scale_transform(predictors, loc, scale, out)
+        assert output is out
+        assert np.array_equal(expected, out)
+
+        in_place = predictors.copy()
+        _ = scale_transform(in_place, loc, scale, in_place)
+        assert np.array_equal(expected, in_place)
+
+    def test_chunked_matches_in_memory(self):
+        predictors = np.random.RandomState(0).randn(1000, 6) * [1, 2, 3, 1e3, 1e-3, 5] + 10
+
+        expected = self._func(predictors)
+        expected_loc, expected_scale = self._fit(predictors)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'data.npy')
+            np.save(path, predictors)
+            data = np.load(path, mmap_mode='r')
+            out = np.lib.format.open_memmap(os.path.join(directory, 'out.npy'), mode='w+',
+                                            dtype=np.float64, shape=data.shape)
+
+            for block_size in 1, 7, 256, 1000, 5000:
+                loc, scale = self._fit_chunked(row_blocks(data, block_size))
+                assert np.allclose(loc, expected_loc)
+                assert np.allclose(scale, expected_scale)
+
+                output = scale_transform_chunked(data, loc, scale, out, block_size)
+                assert output is out
+                assert np.allclose(expected, out)
+
+            del data, out
+
+    def test_chunked_fit_no_data(self):
+        with raises(ValueError):
+            _ = self._fit_chunked(iter([]))
+
+    def test_transform_invalid_arguments(self):
+        predictors = load_iris().data
+        loc, scale = self._fit(predictors)
+
+        with raises(ValueError):
+            _ = scale_transform(predictors, loc[1:], scale)
+
+        with raises(ValueError):
+            _ = scale_transform(predictors, loc, scale, np.empty((3, 4)))
+
 
 class StandardScaleTests(TestCase, RollingStatsTests):
 
     def setUp(self):
         super().setUp()
         self._func = standard_scale
+        self._fit = standard_scale_fit
+        self._fit_chunked = standard_scale_fit_chunked
         self._scaler = StandardScaler
 
     def test_standard_scale_ddof_one(self):
@@ -40,18 +109,132 @@ class StandardScaleTests(TestCase, RollingStatsTests):
         predictors = load_iris().data
 
         for ddof in -1, 2:
-            with raises(ValueError, message='ddof must be either 0 or 1'):
+            with raises(ValueError, match='ddof must be either 0 or 1'):
                 _ = self._func(predictors, ddof=ddof)
 
+    def test_welford_large_offset(self):
+        data = np.random.RandomState(0).randn(1000, 3) + 1e9
+
+        loc, scale = standard_scale_fit(data, ddof=1)
+        assert np.allclose(loc, data.mean(axis=0), rtol=1e-12)
+        assert np.allclose(scale, data.std(axis=0, ddof=1), rtol=1e-7)
+
 
 class MinMaxScaleTests(TestCase, RollingStatsTests):
 
     def setUp(self):
         super().setUp()
         self._func = min_max_scale
+        self._fit = min_max_scale_fit
+        self._fit_chunked = min_max_scale_fit_chunked
+        self._scaler = MinMaxScaler
+
+
+def iris_with_nans():
+    predictors = load_iris().data.copy()
+    predictors[::7, 0] = np.nan
+    predictors[3, 1] = np.nan
+    predictors[100:110, 3] = np.nan
+    return predictors
+
+
+class NanScaleTests:
+
+    def test_scaled_values_with_nans(self):
+        predictors = iris_with_nans()
+
+        expected = self._scaler().fit_transform(predictors)
+        output = self._func(predictors)
+        assert np.allclose(expected, output, equal_nan=True)
+
+    def test_matches_scaler_without_nans(self):
+        predictors = load_iris().data
+        assert np.allclose(self._func(predictors), self._reference_func(predictors))
+
+
+class NanStandardScaleTests(TestCase, NanScaleTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = nan_standard_scale
+        self._reference_func = standard_scale
+        self._scaler = StandardScaler
+
+
+class NanMinMaxScaleTests(TestCase, NanScaleTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = nan_min_max_scale
+        self._reference_func = min_max_scale
         self._scaler = MinMaxScaler
 
 
+class RobustScaleTests(TestCase, NanScaleTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = robust_scale
+        self._reference_func = lambda data: RobustScaler().fit_transform(data)
+        self._scaler = RobustScaler
+
+    def test_quantile_range(self):
+        predictors = iris_with_nans()
+
+        expected = RobustScaler(quantile_range=(10, 90)).fit_transform(predictors)
+        output = robust_scale(predictors, 10., 90.)
+        assert np.allclose(expected, output, equal_nan=True)
+
+    def test_outlier_does_not_change_scale(self):
+        predictors = load_iris().data.copy()
+        _, expected = robust_scale_fit(predictors)
+
+        predictors[0, :] = 1e6
+        _, output = robust_scale_fit(predictors)
+        assert np.allclose(expected, output, rtol=0.1)
+
+    def test_invalid_quantile_range(self):
+        with raises(ValueError):
+            _ = robust_scale(load_iris().data, 75., 25.)
+
+
+class QuantileTransformTests(TestCase):
+
+    def test_versus_quantile_transformer(self):
+        predictors = np.random.RandomState(0).randn(200, 4)
+
+        expected = QuantileTransformer(n_quantiles=len(predictors)).fit_transform(predictors)
+        output = quantile_transform(predictors)
+        assert np.allclose(expected, output)
+
+    def test_nans_kept(self):
+        predictors = np.random.RandomState(1).randn(200, 3)
+        predictors[::9, 0] = np.nan
+        predictors[50:80, 2] = np.nan
+        output = quantile_transform(predictors)
+
+        for i in range(predictors.shape[1]):
+            present = ~np.isnan(predictors[:, i])
+            column = predictors[present, i:i + 1]
+
+            expected = QuantileTransformer(n_quantiles=len(column)).fit_transform(column)[:, 0]
+            assert np.allclose(expected, output[present, i])
+            assert np.all(np.isnan(output[~present, i]))
+
+    def test_ties(self):
+        # QuantileTransformer only approximately averages over ties, as its
+        # quantiles are interpolated percentiles
+        predictors = load_iris().data
+        output = quantile_transform(predictors)
+
+        for i in range(predictors.shape[1]):
+            feature = predictors[:, i]
+            expected = (rankdata(feature) - 1) / (len(feature) - 1)
+            expected[feature == feature.min()] = 0
+            expected[feature == feature.max()] = 1
+            assert np.allclose(expected, output[:, i])
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main()
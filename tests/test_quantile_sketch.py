@@ -0,0 +1,162 @@
+import os
+import tempfile
+
+import numpy as np
+from numba import njit
+from pytest import approx, raises
+
+import utilities.percentile as perc
+from utilities.quantile_sketch import tdigest_new, tdigest_update, tdigest_merge, tdigest_percentile, tdigest_count
+
+_ = perc  # to prevent it appearing to be an unused import
+
+
+@njit
+def np_percentile_jit(x, q):
+    return np.percentile(x, q)
+
+
+def _rank_errors(data, estimates, q):
+    # fraction of the data below each estimate, versus the requested fraction
+    data_sorted = np.sort(data)
+    ranks = np.searchsorted(data_sorted, estimates) / len(data)
+    return np.abs(ranks - q / 100)
+
+
+def _error_bound(q, compression):
+    return np.pi * np.sqrt(q / 100 * (1 - q / 100)) / compression + 1e-3
+
+
+def test_versus_exact_percentile():
+    data = np.random.RandomState(0).randn(100000)
+    q = np.array([0.1, 1, 10, 25, 50, 75, 90, 99, 99.9])
+
+    state = tdigest_new(100.)
+    tdigest_update(state, data)
+
+    output = tdigest_percentile(state, q)
+    expected = np_percentile_jit(data, q)
+
+    assert np.all(_rank_errors(data, output, q) <= _error_bound(q, 100.))
+    assert np.allclose(output, expected, atol=0.05)
+
+
+def test_extremes():
+    data = np.random.RandomState(1).exponential(size=5000)
+
+    state = tdigest_new()
+    tdigest_update(state, data)
+
+    assert tdigest_percentile(state, 0) == data.min()
+    assert tdigest_percentile(state, 100) == data.max()
+    assert tdigest_count(state) == len(data)
+
+
+def test_merge_chunks():
+    data = np.random.RandomState(2).lognormal(size=200000)
+    q = np.array([1, 5, 50, 95, 99])
+    compression = 200.
+
+    chunks = np.array_split(data, 16)
+    states = []
+    for chunk in chunks:
+        state = tdigest_new(compression)
+        tdigest_update(state, chunk)
+        states.append(state)
+
+    # combine pairwise, as when reducing across processes
+    while len(states) > 1:
+        states = [tdigest_merge(states[i], states[i + 1]) for i in range(0, len(states), 2)]
+    merged = states[0]
+
+    output = tdigest_percentile(merged, q)
+    expected = np_percentile_jit(data, q)
+
+    assert tdigest_count(merged) == len(data)
+    assert np.all(_rank_errors(data, output, q) <= _error_bound(q, compression))
+    assert np.allclose(output, expected, rtol=0.05)
+
+
+def test_serialised_state_round_trip():
+    data = np.random.RandomState(3).rand(1000)
+
+    state = tdigest_new()
+    tdigest_update(state, data)
+
+    restored = np.frombuffer(state.tobytes(), dtype=np.float64).copy()
+    assert tdigest_percentile(restored, 50) == tdigest_percentile(state, 50)
+
+
+def test_merge_leaves_inputs_unchanged():
+    a = tdigest_new()
+    b = tdigest_new()
+    tdigest_update(a, np.random.RandomState(4).rand(5000))
+    tdigest_update(b, np.random.RandomState(5).rand(5000))
+
+    a_before = a.copy()
+    b_before = b.copy()
+    merged = tdigest_merge(a, b)
+
+    assert np.array_equal(a, a_before)
+    assert np.array_equal(b, b_before)
+    assert tdigest_count(merged) == 10000
+
+    _ = tdigest_percentile(b, 50)
+    assert np.array_equal(b, b_before)
+
+
+def test_read_only_memory_mapped_digests():
+    data = np.random.RandomState(6).randn(20000)
+    q = np.array([1, 50, 99])
+
+    a = tdigest_new()
+    b = tdigest_new()
+    tdigest_update(a, data[:10000])
+    tdigest_update(b, data[10000:])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path_a = os.path.join(directory, 'a.npy')
+        path_b = os.path.join(directory, 'b.npy')
+        np.save(path_a, a)
+        np.save(path_b, b)
+
+        mapped_a = np.load(path_a, mmap_mode='r')
+        mapped_b = np.load(path_b, mmap_mode='r')
+
+        assert np.array_equal(tdigest_percentile(mapped_b, q), tdigest_percentile(b, q))
+
+        merged = tdigest_merge(mapped_a, mapped_b)
+        assert np.array_equal(merged, tdigest_merge(a, b))
+        assert tdigest_count(merged) == len(data)
+
+        del mapped_a, mapped_b
+
+    state = np.frombuffer(b.tobytes(), dtype=np.float64)
+    assert tdigest_percentile(state, 50) == tdigest_percentile(b, 50)
+
+
+def test_nans_ignored_and_empty_digest():
+    data = np.array([1, np.nan, 3, 2, np.nan])
+
+    state = tdigest_new()
+    assert np.isnan(tdigest_percentile(state, 50))
+
+    tdigest_update(state, data)
+    assert tdigest_count(state) == 3
+    assert tdigest_percentile(state, 50) == approx(2)
+
+
+def test_invalid_arguments():
+    with raises(ValueError):
+        _ = tdigest_new(0.)
+
+    state = tdigest_new()
+    tdigest_update(state, np.arange(10.))
+
+    with raises(ValueError):
+        _ = tdigest_percentile(state, 101)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
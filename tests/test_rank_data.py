@@ -1,8 +1,10 @@
 import numpy as np
+import pandas as pd
+from pytest import raises
 from scipy.stats import rankdata
 from sklearn.datasets import load_iris
 
-from utilities.rank_data import rank_data
+from utilities.rank_data import rank_data, rank_data_parallel, rank_along_axis
 
 
 def test_rank_data():
@@ -18,6 +20,85 @@ def test_rank_data():
         assert np.allclose(expected, output[:, i])
 
 
+def test_rank_data_parallel():
+    data = load_iris().data
+    assert np.array_equal(rank_data(data), rank_data_parallel(data))
+
+    data = np.random.RandomState(0).randint(0, 20, (500, 7))
+    output = rank_data_parallel(data)
+    for i in range(data.shape[1]):
+        assert np.array_equal(rankdata(data[:, i]), output[:, i])
+
+
+def test_rank_data_parallel_large_integers():
+    # distinct as int64, but tied once converted to float64
+    data = np.array([[2 ** 53 + 1], [2 ** 53], [1]], dtype=np.int64)
+    assert np.array_equal(rank_data_parallel(data)[:, 0], [3., 2., 1.])
+
+
+def test_rank_data_parallel_nans_last():
+    data = np.array([[3., np.nan], [np.nan, 1.], [1., 1.], [2., 0.]])
+    expected = np.array([[3., 4.], [4., 2.5], [1., 2.5], [2., 1.]])
+    assert np.array_equal(rank_data_parallel(data), expected)
+
+
+def sample_panel():
+    data = np.random.RandomState(1).randint(0, 6, (40, 9)).astype(float)
+    data[::5, 2] = np.nan
+    data[7, :] = np.nan
+    data[:, 4] = np.nan
+    data[3, 0] = np.nan
+    return data
+
+
+def test_rank_along_axis_versus_pandas():
+    data = sample_panel()
+    df = pd.DataFrame(data)
+
+    for axis in 0, 1:
+        for method in 'average', 'min', 'max', 'dense':
+            for na_option in 'keep', 'top', 'bottom':
+                for pct in False, True:
+                    expected = df.rank(axis=axis, method=method, na_option=na_option, pct=pct).values
+                    output = rank_along_axis(data, axis, method, na_option, pct)
+                    assert np.allclose(expected, output, equal_nan=True)
+
+
+def test_rank_along_axis_ordinal():
+    data = np.random.RandomState(2).randint(0, 5, (30, 4))
+
+    for axis in 0, 1:
+        output = rank_along_axis(data, axis, 'ordinal')
+        expected = rankdata(data, method='ordinal', axis=axis)
+        assert np.array_equal(expected, output)
+
+    # pandas calls ordinal ranking 'first'
+    data = sample_panel()
+    expected = pd.DataFrame(data).rank(axis=1, method='first', na_option='bottom').values
+    assert np.array_equal(expected, rank_along_axis(data, 1, 'ordinal', 'bottom'))
+
+
+def test_rank_along_axis_versus_scipy():
+    data = np.random.RandomState(3).randn(25, 6)
+
+    for method in 'average', 'min', 'max', 'dense', 'ordinal':
+        assert np.array_equal(rankdata(data, method=method, axis=1), rank_along_axis(data, 1, method))
+        assert np.array_equal(rankdata(data[:, 0], method=method), rank_along_axis(data[:, 0], method=method))
+
+
+def test_rank_along_axis_invalid_arguments():
+    data = sample_panel()
+
+    with raises(ValueError):
+        _ = rank_along_axis(data, method='first')
+
+    with raises(ValueError):
+        _ = rank_along_axis(data, na_option='drop')
+
+    with raises(ValueError):
+        _ = rank_along_axis(data, axis=2)
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main()
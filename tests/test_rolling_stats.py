@@ -2,12 +2,21 @@ import pandas as pd
 import numpy as np
 
 from unittest import TestCase
-from utilities.rolling_stats import rolling_sum, rolling_mean
+from scipy.stats import spearmanr, kendalltau
+from utilities.rolling_stats import rolling_sum, rolling_mean, rolling_sum_accumulator, rolling_mean_accumulator
+from utilities.rolling_stats import rolling_var, rolling_std, rolling_skew, rolling_kurt
+from utilities.rolling_stats import rolling_median, rolling_quantile
+from utilities.rolling_stats import rolling_rank, rolling_spearman, rolling_kendall
+from utilities.rolling_stats import rolling_cov, rolling_corr, rolling_beta, rolling_ols
+from utilities.rolling_stats import rolling_min, rolling_max, rolling_argmin, rolling_argmax, rolling_drawdown
 from pytest import raises
 
 
 class RollingStatsTests:
 
+    def _expected(self, s, window):
+        return getattr(s.rolling(window=window), self._pandas_func_name)().values
+
     def test_series_containing_nans(self):
         x = np.arange(30).astype(float)
         s = pd.Series(x)
@@ -18,7 +27,7 @@ class RollingStatsTests:
 
         window = 3
 
-        expected = getattr(s.rolling(window=window), self._pandas_func_name)().values
+        expected = self._expected(s, window)
         output = self._func(s.values, window)
         assert np.allclose(output, expected, equal_nan=True)
 
@@ -28,7 +37,7 @@ class RollingStatsTests:
 
         window = 5
 
-        expected = getattr(s.rolling(window=window), self._pandas_func_name)().values
+        expected = self._expected(s, window)
         output = self._func(s.values, window)
         assert np.allclose(output, expected, equal_nan=True)
 
@@ -38,20 +47,10 @@ class RollingStatsTests:
         s[:10] = np.nan
 
         for window in 1, 2, 5, 10, 30, 50:
-            expected = getattr(s.rolling(window=window), self._pandas_func_name)().values
+            expected = self._expected(s, window)
             output = self._func(s.values, window)
             assert np.allclose(output, expected, equal_nan=True)
 
-    def test_series_window_size_one(self):
-        x = np.arange(10).astype(float)
-        s = pd.Series(x)
-        window = 1
-
-        expected = getattr(s.rolling(window=window), self._pandas_func_name)().values
-        output = self._func(s.values, window)
-        assert np.allclose(output, expected)
-        assert np.allclose(output, s.values)
-
     def test_series_window_size_zero(self):
         x = np.arange(10).astype(float)
         s = pd.Series(x)
@@ -65,26 +64,551 @@ class RollingStatsTests:
         s = pd.Series(x)
         window = -1
 
-        with raises(ValueError, message="window must be non-negative"):
+        with raises(ValueError, match="window must be non-negative"):
             _ = self._func(s.values, window)
 
+    def test_series_nans_one_window_apart(self):
+        x = np.arange(12).astype(float)
+        s = pd.Series(x)
+        s[0] = np.nan
+        s[3] = np.nan
+
+        window = 3
+
+        expected = self._expected(s, window)
+        output = self._func(s.values, window)
+        assert np.allclose(output, expected, equal_nan=True)
+
+    def test_frame_columns(self):
+        x = np.random.RandomState(0).rand(60, 7)
+        x[5, 2] = np.nan
+        x[20:25, 4] = np.nan
+        df = pd.DataFrame(x)
+
+        for window in 1, 3, 10:
+            expected = self._expected(df, window)
+            output = self._func(x, window)
+            assert output.shape == x.shape
+            assert np.allclose(output, expected, equal_nan=True)
+
+    def test_frame_rows(self):
+        x = np.random.RandomState(1).rand(7, 60)
+        x[2, 5] = np.nan
+        df = pd.DataFrame(x.T)
+
+        window = 4
+
+        expected = self._expected(df, window).T
+        output = self._func(x, window, axis=1)
+        assert np.allclose(output, expected, equal_nan=True)
+
+    def test_frame_matches_series(self):
+        x = np.random.RandomState(2).rand(50, 3)
+        window = 6
+
+        output = self._func(x, window)
+        for j in range(x.shape[1]):
+            assert np.allclose(output[:, j], self._func(x[:, j], window), equal_nan=True)
+
+    def test_frame_invalid_axis(self):
+        x = np.random.RandomState(3).rand(10, 3)
+
+        with raises(ValueError):
+            _ = self._func(x, 3, axis=2)
 
-class RollingMeanTests(TestCase, RollingStatsTests):
+
+class RollingSumMeanTests(RollingStatsTests):
+
+    def test_series_window_size_one(self):
+        x = np.arange(10).astype(float)
+        s = pd.Series(x)
+        window = 1
+
+        expected = self._expected(s, window)
+        output = self._func(s.values, window)
+        assert np.allclose(output, expected)
+        assert np.allclose(output, s.values)
+
+    def test_accumulator_matches_batch(self):
+        x = np.random.RandomState(4).randn(200)
+        x[10] = np.nan
+        x[50:60] = np.nan
+        x[100] = np.nan
+        x[103] = np.nan
+        chunk_ends = [1, 2, 17, 18, 60, 121, 200]
+
+        for window in 0, 1, 2, 3, 7, 30:
+            expected = self._func(x, window)
+
+            accumulator = self._accumulator(window)
+            start = 0
+            chunks = []
+            for end in chunk_ends:
+                chunks.append(accumulator.update(x[start:end]))
+                start = end
+
+            output = np.concatenate(chunks)
+            assert np.array_equal(output, expected, equal_nan=True)
+
+    def test_accumulator_push(self):
+        x = np.arange(20).astype(float)
+        x[4] = np.nan
+        window = 3
+
+        expected = self._func(x, window)
+
+        accumulator = self._accumulator(window)
+        output = np.array([accumulator.push(v) for v in x])
+        assert np.array_equal(output, expected, equal_nan=True)
+
+    def test_accumulator_window_size_negative(self):
+        with raises(ValueError):
+            _ = self._accumulator(-1)
+
+
+class RollingMeanTests(TestCase, RollingSumMeanTests):
 
     def setUp(self):
         super().setUp()
         self._func = rolling_mean
+        self._accumulator = rolling_mean_accumulator
         self._pandas_func_name = 'mean'
 
 
-class RollingSumTests(TestCase, RollingStatsTests):
+class RollingSumTests(TestCase, RollingSumMeanTests):
 
     def setUp(self):
         super().setUp()
         self._func = rolling_sum
+        self._accumulator = rolling_sum_accumulator
         self._pandas_func_name = 'sum'
 
 
+class RollingMomentTests(RollingStatsTests):
+
+    def test_series_random_with_nans(self):
+        x = np.random.RandomState(5).randn(500)
+        x[[20, 21, 150, 158, 300]] = np.nan
+        s = pd.Series(x)
+
+        for window in 1, 2, 3, 4, 8, 50:
+            expected = self._expected(s, window)
+            output = self._func(x, window)
+            assert np.allclose(output, expected, equal_nan=True)
+
+    def test_series_large_offset(self):
+        x = 1e9 + np.random.RandomState(6).randn(20000)
+        window = 25
+
+        # reference computed window by window on the values after removing the offset
+        s = pd.Series(x - 1e9)
+        expected = self._expected(s, window)
+        output = self._func(x, window)
+        assert np.allclose(output, expected, equal_nan=True, rtol=1e-4, atol=1e-6)
+
+    def test_series_constant_window(self):
+        x = np.array([1., 2., 3., 3., 3., 3., 3., 4., 2.])
+        s = pd.Series(x)
+        window = 4
+
+        expected = self._expected(s, window)
+        output = self._func(x, window)
+        assert np.allclose(output, expected, equal_nan=True)
+
+
+class RollingVarTests(TestCase, RollingMomentTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_var
+        self._pandas_func_name = 'var'
+
+    def test_series_ddof_zero(self):
+        x = np.random.RandomState(7).randn(100)
+        x[40] = np.nan
+        s = pd.Series(x)
+
+        for window in 1, 2, 10:
+            expected = s.rolling(window=window).var(ddof=0).values
+            output = rolling_var(x, window, ddof=0)
+            assert np.allclose(output, expected, equal_nan=True)
+
+
+class RollingStdTests(TestCase, RollingMomentTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_std
+        self._pandas_func_name = 'std'
+
+
+class RollingSkewTests(TestCase, RollingMomentTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_skew
+        self._pandas_func_name = 'skew'
+
+    def _expected(self, s, window):
+        # pandas' rolling skew stays NaN after the first NaN when window is 3,
+        # so the reference is computed on each window separately
+        return s.rolling(window=window).apply(lambda v: pd.Series(v).skew(), raw=True).values
+
+
+class RollingKurtTests(TestCase, RollingMomentTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_kurt
+        self._pandas_func_name = 'kurt'
+
+
+class RollingQuantileTests(TestCase, RollingStatsTests):
+
+    def setUp(self):
+        super().setUp()
+        self._quantile = 0.3
+        self._func = lambda x, window, axis=0: rolling_quantile(x, window, self._quantile, axis)
+
+    def _expected(self, s, window):
+        # NaNs within the window are skipped, as in np.nanpercentile
+        func = lambda v: np.nanpercentile(v, 100 * self._quantile)
+        expected = s.rolling(window=window, min_periods=1).apply(func, raw=True).to_numpy(copy=True)
+        expected[:window - 1] = np.nan
+        return expected
+
+    def test_series_versus_pandas(self):
+        x = np.random.RandomState(8).randn(1000)
+        x[::7] = x[3]  # plenty of ties
+        s = pd.Series(x)
+
+        for window in 1, 2, 5, 50:
+            for quantile in 0, 0.1, 0.25, 0.5, 0.9, 1:
+                expected = s.rolling(window=window).quantile(quantile).values
+                output = rolling_quantile(x, window, quantile)
+                assert np.allclose(output, expected, equal_nan=True)
+
+    def test_all_nan_window(self):
+        x = np.arange(12).astype(float)
+        x[3:8] = np.nan
+        window = 4
+
+        output = rolling_quantile(x, window, self._quantile)
+        assert np.all(np.isnan(output[[0, 1, 2, 6, 7]]))
+        assert not np.any(np.isnan(output[[3, 4, 5, 8]]))
+
+    def test_quantile_out_of_range(self):
+        x = np.arange(10).astype(float)
+
+        for quantile in -0.1, 1.1, np.nan:
+            with raises(ValueError):
+                _ = rolling_quantile(x, 3, quantile)
+
+
+class RollingMedianTests(TestCase, RollingStatsTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_median
+
+    def _expected(self, s, window):
+        expected = s.rolling(window=window, min_periods=1).apply(np.nanmedian, raw=True).to_numpy(copy=True)
+        expected[:window - 1] = np.nan
+        return expected
+
+    def test_series_versus_pandas(self):
+        x = np.random.RandomState(9).randn(1000)
+        s = pd.Series(x)
+
+        for window in 1, 2, 5, 50:
+            expected = s.rolling(window=window).median().values
+            output = rolling_median(x, window)
+            assert np.allclose(output, expected, equal_nan=True)
+
+
+class RollingRankTests(TestCase, RollingStatsTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_rank
+        self._pandas_func_name = 'rank'
+
+    def test_series_with_ties(self):
+        x = np.random.RandomState(10).randint(0, 5, 300).astype(float)
+        x[40] = np.nan
+        s = pd.Series(x)
+
+        for window in 1, 2, 7, 30:
+            for pct in False, True:
+                expected = s.rolling(window=window).rank(pct=pct).values
+                output = rolling_rank(x, window, pct)
+                assert np.allclose(output, expected, equal_nan=True)
+
+
+class RollingExtremeTests(RollingStatsTests):
+
+    def test_series_with_ties(self):
+        x = np.random.RandomState(17).randint(0, 5, 300).astype(float)
+        x[[20, 21, 150]] = np.nan
+        s = pd.Series(x)
+
+        for window in 1, 2, 3, 17, 100:
+            expected = self._expected(s, window)
+            output = self._func(x, window)
+            assert np.allclose(output, expected, equal_nan=True)
+
+
+class RollingMinTests(TestCase, RollingExtremeTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_min
+        self._pandas_func_name = 'min'
+
+
+class RollingMaxTests(TestCase, RollingExtremeTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_max
+        self._pandas_func_name = 'max'
+
+    def test_drawdown(self):
+        prices = np.array([10., 12., 9., 11., 13., 6., 7.])
+
+        output = rolling_drawdown(prices, 3)
+        expected = [np.nan, np.nan, 9 / 12 - 1, 11 / 12 - 1, 0., 6 / 13 - 1, 7 / 13 - 1]
+        assert np.allclose(output, expected, equal_nan=True)
+
+        frame = np.column_stack([prices, 2 * prices])
+        assert np.allclose(rolling_drawdown(frame, 3), np.column_stack([output, output]), equal_nan=True)
+
+
+class RollingArgminTests(TestCase, RollingExtremeTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_argmin
+
+    def _expected(self, s, window):
+        return s.rolling(window=window).apply(np.argmin, raw=True).values
+
+
+class RollingArgmaxTests(TestCase, RollingExtremeTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_argmax
+
+    def _expected(self, s, window):
+        return s.rolling(window=window).apply(np.argmax, raw=True).values
+
+
+def _expected_pair(func, x, y, window):
+    expected = np.full(len(x), np.nan)
+    for i in range(window - 1, len(x)):
+        x_i = x[i - window + 1:i + 1]
+        y_i = y[i - window + 1:i + 1]
+        if not (np.isnan(x_i).any() or np.isnan(y_i).any()):
+            if len(np.unique(x_i)) > 1 and len(np.unique(y_i)) > 1:
+                expected[i] = func(x_i, y_i)[0]
+    return expected
+
+
+class RollingPairTests:
+
+    def test_versus_scipy(self):
+        random_state = np.random.RandomState(11)
+        x = random_state.randn(200)
+        y = x + random_state.randn(200)
+        x[50] = np.nan
+        y[80:83] = np.nan
+
+        for window in 2, 3, 10, 40:
+            expected = _expected_pair(self._scipy_func, x, y, window)
+            output = self._func(x, y, window)
+            assert np.allclose(output, expected, equal_nan=True)
+
+    def test_ties_versus_scipy(self):
+        random_state = np.random.RandomState(12)
+        x = random_state.randint(0, 4, 150).astype(float)
+        y = random_state.randint(0, 3, 150).astype(float)
+
+        for window in 5, 20:
+            expected = _expected_pair(self._scipy_func, x, y, window)
+            output = self._func(x, y, window)
+            assert np.allclose(output, expected, equal_nan=True)
+
+    def test_constant_window(self):
+        x = np.ones(10)
+        y = np.arange(10).astype(float)
+
+        assert np.all(np.isnan(self._func(x, y, 3)))
+
+    def test_frame_columns(self):
+        random_state = np.random.RandomState(13)
+        x = random_state.randn(60, 4)
+        y = random_state.randn(60, 4)
+        window = 8
+
+        output = self._func(x, y, window)
+        for j in range(x.shape[1]):
+            assert np.array_equal(output[:, j], self._func(x[:, j], y[:, j], window), equal_nan=True)
+
+        assert np.array_equal(self._func(x.T, y.T, window, axis=1), output.T, equal_nan=True)
+
+    def test_invalid_arguments(self):
+        x = np.arange(10).astype(float)
+
+        with raises(ValueError):
+            _ = self._func(x, x[1:], 3)
+
+        with raises(ValueError, match="window must be non-negative"):
+            _ = self._func(x, x, -1)
+
+        assert np.all(np.isnan(self._func(x, x, 0)))
+
+
+class RollingSpearmanTests(TestCase, RollingPairTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_spearman
+        self._scipy_func = spearmanr
+
+
+class RollingKendallTests(TestCase, RollingPairTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_kendall
+        self._scipy_func = kendalltau
+
+
+class RollingComomentTests(RollingPairTests):
+
+    def test_ties_versus_scipy(self):
+        # covariance and beta stay defined when only y is constant, so
+        # compare with pandas rather than the rank correlation reference
+        random_state = np.random.RandomState(12)
+        x = pd.Series(random_state.randint(0, 4, 150).astype(float))
+        y = pd.Series(random_state.randint(0, 3, 150).astype(float))
+
+        for window in 5, 20:
+            expected = self._pandas_func(x, y, window)
+            output = self._func(x.values, y.values, window)
+            assert np.allclose(output, expected, equal_nan=True)
+
+    def test_versus_pandas(self):
+        random_state = np.random.RandomState(14)
+        x = random_state.randn(300) + 100
+        y = 0.5 * x + random_state.randn(300)
+        x[30] = np.nan
+        y[100:104] = np.nan
+
+        for window in 2, 3, 10, 60:
+            expected = self._pandas_func(pd.Series(x), pd.Series(y), window)
+            output = self._func(x, y, window)
+            assert np.allclose(output, expected, equal_nan=True)
+
+    def test_frame_versus_pandas(self):
+        random_state = np.random.RandomState(15)
+        x = pd.DataFrame(random_state.randn(80, 5))
+        y = pd.DataFrame(random_state.randn(80, 5))
+        window = 12
+
+        output = self._func(x.values, y.values, window)
+        for j in range(x.shape[1]):
+            expected = self._pandas_func(x[j], y[j], window)
+            assert np.allclose(output[:, j], expected, equal_nan=True)
+
+
+class RollingCovTests(TestCase, RollingComomentTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_cov
+        self._scipy_func = lambda a, b: (np.cov(a, b)[0, 1],)
+        self._pandas_func = lambda a, b, window: a.rolling(window).cov(b).values
+
+    def test_constant_window(self):
+        x = np.ones(10)
+        y = np.arange(10).astype(float)
+
+        output = self._func(x, y, 3)
+        assert np.all(np.isnan(output[:2]))
+        assert np.all(output[2:] == 0)
+
+
+class RollingCorrTests(TestCase, RollingComomentTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_corr
+        self._scipy_func = lambda a, b: (np.corrcoef(a, b)[0, 1],)
+        self._pandas_func = lambda a, b, window: a.rolling(window).corr(b).values
+
+
+class RollingBetaTests(TestCase, RollingComomentTests):
+
+    def setUp(self):
+        super().setUp()
+        self._func = rolling_beta
+        self._scipy_func = lambda a, b: np.polyfit(a, b, 1)
+        self._pandas_func = lambda a, b, window: (a.rolling(window).cov(b) / a.rolling(window).var()).values
+
+
+def _expected_ols(y, X, window):
+    expected = np.full((len(y), X.shape[1]), np.nan)
+    for i in range(window - 1, len(y)):
+        y_i = y[i - window + 1:i + 1]
+        X_i = X[i - window + 1:i + 1]
+        if not (np.isnan(y_i).any() or np.isnan(X_i).any()):
+            expected[i] = np.linalg.lstsq(X_i, y_i, rcond=None)[0]
+    return expected
+
+
+class RollingOlsTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        random_state = np.random.RandomState(16)
+        self.X = np.column_stack([np.ones(150), random_state.randn(150, 3)])
+        self.y = self.X @ [1., 2., -1., 0.5] + 0.1 * random_state.randn(150)
+        self.X[40, 2] = np.nan
+        self.y[90] = np.nan
+
+    def test_versus_lstsq(self):
+        for window in 5, 20, 60:
+            expected = _expected_ols(self.y, self.X, window)
+            output = rolling_ols(self.y, self.X, window)
+            assert np.allclose(output, expected, equal_nan=True)
+
+    def test_many_series(self):
+        ys = np.column_stack([self.y, 2 * self.y, -self.y])
+        window = 20
+
+        output = rolling_ols(ys, self.X, window)
+        assert output.shape == (150, 3, 4)
+        for j in range(ys.shape[1]):
+            assert np.allclose(output[:, j, :], rolling_ols(ys[:, j], self.X, window), equal_nan=True)
+
+    def test_singular_window(self):
+        X = np.column_stack([np.ones(30), np.ones(30)])
+        y = np.arange(30).astype(float)
+
+        assert np.all(np.isnan(rolling_ols(y, X, 10)))
+
+    def test_invalid_arguments(self):
+        with raises(ValueError):
+            _ = rolling_ols(self.y, self.X, -1)
+
+        with raises(ValueError):
+            _ = rolling_ols(self.y[1:], self.X, 5)
+
+        assert np.all(np.isnan(rolling_ols(self.y, self.X, 0)))
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main()
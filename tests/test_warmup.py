@@ -0,0 +1,33 @@
+from pytest import raises
+
+from utilities.warmup import warmup, main, _TARGETS
+
+
+def test_warmup_times_each_target():
+    timings = warmup(('float64',))
+
+    assert set(timings) == {(name, 'float64') for name, _, _ in _TARGETS}
+    assert all(t >= 0 for t in timings.values())
+
+
+def test_only_supported_dtypes():
+    timings = warmup(('int64',))
+
+    assert set(timings) == {(name, 'int64') for name, _, supported in _TARGETS if 'int64' in supported}
+
+
+def test_command_line(capsys):
+    timings = main(['--dtypes', 'float64', '--quiet'])
+
+    assert len(timings) == len(_TARGETS)
+    assert capsys.readouterr().out.startswith('total')
+
+
+def test_invalid_dtype():
+    with raises(ValueError):
+        _ = warmup(('complex128',))
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -1,9 +1,41 @@
+import math
+
+import numpy as np
 from numba import cuda
 import numba
-from numba import float32
+from numba import float32, float64, njit, prange
+
+
+class _LazyKernel:
+    """
+    CUDA kernel compiled for its signature on first use, rather than at
+    import, so that the module (and its CPU fallback) can be used on
+    machines without a GPU.
+    """
+
+    def __init__(self, signature, py_func):
+        self._signature = signature
+        self._kernel = None
+        self.py_func = py_func
+
+    @property
+    def kernel(self):
+        if self._kernel is None:
+            self._kernel = numba.cuda.jit(self._signature)(self.py_func)
+        return self._kernel
+
+    def __getitem__(self, config):
+        return self.kernel[config]
+
+
+def _cuda_jit(signature):
+    if cuda.is_available():
+        return numba.cuda.jit(signature)
 
+    return lambda py_func: _LazyKernel(signature, py_func)
 
-@numba.cuda.jit("void(float32[:,:], float32[:,:], float32[:,:])")
+
+@_cuda_jit("void(float32[:,:], float32[:,:], float32[:,:])")
 def naive_matrix_mult(A, B, C):
 
     n = A.shape[0]
@@ -17,7 +49,7 @@ def naive_matrix_mult(A, B, C):
         C[y, x] += A[y, i] * B[i, x]
 
 
-@numba.cuda.jit("void(float32[:,:], float32[:,:], float32[:,:])")
+@_cuda_jit("void(float32[:,:], float32[:,:], float32[:,:])")
 def optimised_matrix_mult(A, B, C):
 
     n = A.shape[0]
@@ -55,6 +87,423 @@ def optimised_matrix_mult(A, B, C):
         C[y, x] = acc
 
 
+# Each block computes a TILE x TILE tile of C with TILE x ROWS_PER_THREAD
+# threads, each of which accumulates WORK_PER_THREAD outputs of one column
+# in registers, so each value read from shared memory is reused
+TILE = 32
+WORK_PER_THREAD = 4
+ROWS_PER_THREAD = TILE // WORK_PER_THREAD
+
+
+def _make_tiled_matrix_mult(dtype):
+    """
+    Tiled kernels for C = A @ B with A (m, k) and B (k, n) of any shape,
+    compiled for the given numba float type: one for a single product,
+    and one for stacks of products, with the index into the stack given
+    by the z dimension of the grid.  Tiles overhanging the edges of A and
+    B are zero-filled, and outputs outside C are masked.
+    """
+
+    @cuda.jit(device=True)
+    def tile_product(A, B, C):
+
+        m, k = A.shape
+        n = B.shape[1]
+
+        sA = cuda.shared.array(shape=(TILE, TILE), dtype=dtype)
+        sB = cuda.shared.array(shape=(TILE, TILE), dtype=dtype)
+        acc = cuda.local.array(WORK_PER_THREAD, dtype=dtype)
+
+        tx = cuda.threadIdx.x
+        ty = cuda.threadIdx.y
+        row_start = cuda.blockIdx.y * TILE
+        col = cuda.blockIdx.x * TILE + tx
+
+        for w in range(WORK_PER_THREAD):
+            acc[w] = 0
+
+        for t in range((k + TILE - 1) // TILE):
+            offset = t * TILE
+
+            # Prefill cache, with zeros beyond the edges of A and B
+            for w in range(WORK_PER_THREAD):
+                r = ty + w * ROWS_PER_THREAD
+
+                if row_start + r < m and offset + tx < k:
+                    sA[r, tx] = A[row_start + r, offset + tx]
+                else:
+                    sA[r, tx] = 0
+
+                if offset + r < k and col < n:
+                    sB[r, tx] = B[offset + r, col]
+                else:
+                    sB[r, tx] = 0
+
+            cuda.syncthreads()
+
+            for j in range(TILE):
+                b = sB[j, tx]
+                for w in range(WORK_PER_THREAD):
+                    acc[w] += sA[ty + w * ROWS_PER_THREAD, j] * b
+
+            cuda.syncthreads()
+
+        for w in range(WORK_PER_THREAD):
+            row = row_start + ty + w * ROWS_PER_THREAD
+            if row < m and col < n:
+                C[row, col] = acc[w]
+
+    @_cuda_jit(numba.void(dtype[:, :], dtype[:, :], dtype[:, :]))
+    def tiled_matrix_mult(A, B, C):
+        tile_product(A, B, C)
+
+    @_cuda_jit(numba.void(dtype[:, :, :], dtype[:, :, :], dtype[:, :, :]))
+    def batched_tiled_matrix_mult(A, B, C):
+        b = cuda.blockIdx.z
+        tile_product(A[b], B[b], C[b])
+
+    return tiled_matrix_mult, batched_tiled_matrix_mult
+
+
+tiled_matrix_mult_float32, batched_tiled_matrix_mult_float32 = _make_tiled_matrix_mult(float32)
+tiled_matrix_mult_float64, batched_tiled_matrix_mult_float64 = _make_tiled_matrix_mult(float64)
+
+_TILED_KERNELS = {
+    np.dtype(np.float32): tiled_matrix_mult_float32,
+    np.dtype(np.float64): tiled_matrix_mult_float64,
+}
+
+_BATCHED_TILED_KERNELS = {
+    np.dtype(np.float32): batched_tiled_matrix_mult_float32,
+    np.dtype(np.float64): batched_tiled_matrix_mult_float64,
+}
+
+# the most blocks a grid may have in its z dimension
+MAX_GRID_Z = 65535
+
+
+def _launch_config(m, n, batch=None):
+    griddim = math.ceil(n / TILE), math.ceil(m / TILE)
+    if batch is not None:
+        griddim += (batch,)
+    blockdim = TILE, ROWS_PER_THREAD
+    return griddim, blockdim
+
+
+def _result_dtype(A, B):
+    return np.dtype(np.float32) if A.dtype == B.dtype == np.float32 else np.dtype(np.float64)
+
+
+def gemm(A, B):
+    """
+    A @ B on the GPU with the tiled kernel, for 2-D arrays of any
+    compatible shapes.  The product is float32 if both are float32,
+    and float64 otherwise.
+    """
+    if A.ndim != 2 or B.ndim != 2 or A.shape[1] != B.shape[0]:
+        raise ValueError('A and B must be 2 dimensional with A.shape[1] == B.shape[0]')
+
+    dtype = _result_dtype(A, B)
+    kernel = _TILED_KERNELS[dtype]
+
+    m, n = A.shape[0], B.shape[1]
+
+    dA = cuda.to_device(np.ascontiguousarray(A, dtype=dtype))
+    dB = cuda.to_device(np.ascontiguousarray(B, dtype=dtype))
+    dC = cuda.device_array((m, n), dtype=dtype)
+
+    if m > 0 and n > 0:
+        griddim, blockdim = _launch_config(m, n)
+        kernel[griddim, blockdim](dA, dB, dC)
+
+    return dC.copy_to_host()
+
+
+class _BufferPool:
+    """
+    Device and pinned host buffers kept between calls, since allocating
+    either costs far more than reusing one.  Buffers are flat, with the
+    number of elements rounded up to a power of two, so that arrays of
+    similar sizes share them, and are handed out as views of the shape
+    asked for.  Once the idle buffers take more than max_bytes, the least
+    recently released are freed.
+    """
+
+    def __init__(self, max_bytes=2 ** 30):
+        self.max_bytes = max_bytes
+        self._free = []  # (kind, capacity, dtype, buffer), least recently released first
+        self._free_bytes = 0
+
+    def acquire(self, kind, shape, dtype):
+        dtype = np.dtype(dtype)
+        size = math.prod(shape)
+        capacity = 1 << max(size - 1, 0).bit_length()
+
+        for i in range(len(self._free) - 1, -1, -1):
+            if self._free[i][:3] == (kind, capacity, dtype):
+                buffer = self._free.pop(i)[3]
+                self._free_bytes -= buffer.nbytes
+                break
+        else:
+            if kind == 'device':
+                buffer = cuda.device_array(capacity, dtype=dtype)
+            else:
+                buffer = cuda.pinned_array(capacity, dtype=dtype)
+
+        return buffer, buffer[:size].reshape(shape)
+
+    def release(self, kind, buffer):
+        self._free.append((kind, buffer.shape[0], buffer.dtype, buffer))
+        self._free_bytes += buffer.nbytes
+
+        while self._free_bytes > self.max_bytes:
+            self._free_bytes -= self._free.pop(0)[3].nbytes
+
+    def clear(self):
+        self._free.clear()
+        self._free_bytes = 0
+
+
+buffer_pool = _BufferPool()
+
+PANEL_ROWS = 1024
+N_STREAMS = 4
+# elements of A, B and the product in each chunk of a stack of matrices
+BATCH_ELEMENTS = 2 ** 22
+
+
+def _to_device(host, dtype, stream, buffers):
+    # stage through pinned memory so the copy can run asynchronously
+    pinned_buffer, pinned = buffer_pool.acquire('pinned', host.shape, dtype)
+    pinned[...] = host
+    device_buffer, device = buffer_pool.acquire('device', host.shape, dtype)
+    device.copy_to_device(pinned, stream=stream)
+
+    buffers.append(('pinned', pinned_buffer))
+    buffers.append(('device', device_buffer))
+
+    return device
+
+
+def _finish(job):
+    stream, pinned_out, out_block, buffers = job
+
+    stream.synchronize()
+    out_block[...] = pinned_out
+
+    for kind, buffer in buffers:
+        buffer_pool.release(kind, buffer)
+
+
+def _run_on_streams(jobs, shared_B, dtype, streams):
+    """
+    Multiply each (A block, B block or None for shared_B, out block) job on
+    the GPU, with successive jobs on successive streams so that the copies
+    of one overlap with the computation of another.  The blocks are either
+    matrices or stacks of them, each stack multiplied by a single launch.
+    At most one job per stream is in flight, which bounds the device
+    memory used.
+    """
+    in_flight = [None] * len(streams)
+
+    shared_buffers = []
+    if shared_B is not None:
+        dB_shared = _to_device(shared_B, dtype, streams[0], shared_buffers)
+        streams[0].synchronize()
+
+    for i, (a, b, out_block) in enumerate(jobs):
+        slot = i % len(streams)
+        if in_flight[slot] is not None:
+            _finish(in_flight[slot])
+
+        stream = streams[slot]
+        buffers = []
+
+        dA = _to_device(a, dtype, stream, buffers)
+        dB = dB_shared if b is None else _to_device(b, dtype, stream, buffers)
+
+        dC_buffer, dC = buffer_pool.acquire('device', out_block.shape, dtype)
+        if out_block.ndim == 2:
+            griddim, blockdim = _launch_config(*out_block.shape)
+            _TILED_KERNELS[dtype][griddim, blockdim, stream](dA, dB, dC)
+        else:
+            griddim, blockdim = _launch_config(*out_block.shape[1:], batch=out_block.shape[0])
+            _BATCHED_TILED_KERNELS[dtype][griddim, blockdim, stream](dA, dB, dC)
+
+        pinned_out_buffer, pinned_out = buffer_pool.acquire('pinned', out_block.shape, dtype)
+        dC.copy_to_host(pinned_out, stream=stream)
+
+        buffers.append(('device', dC_buffer))
+        buffers.append(('pinned', pinned_out_buffer))
+        in_flight[slot] = stream, pinned_out, out_block, buffers
+
+    for job in in_flight:
+        if job is not None:
+            _finish(job)
+
+    for kind, buffer in shared_buffers:
+        buffer_pool.release(kind, buffer)
+
+
+# cache blocking for the CPU kernel: a BLOCK_K x BLOCK_N panel of B is
+# reused across BLOCK_M rows of A while it stays in cache
+BLOCK_M = 64
+BLOCK_K = 128
+BLOCK_N = 512
+
+
+@njit(parallel=True, cache=True)
+def cpu_matrix_mult(A, B, out):
+    """
+    out = A @ B, cache-blocked, with blocks of rows of out computed in
+    parallel.  Each row of a block of out is accumulated in a local
+    buffer, which the compiler can keep apart from A and B and so
+    vectorise the innermost loop.
+    """
+    m, k = A.shape
+    n = B.shape[1]
+
+    for row_block in prange((m + BLOCK_M - 1) // BLOCK_M):
+        i_start = row_block * BLOCK_M
+        i_stop = min(i_start + BLOCK_M, m)
+        acc = np.empty(BLOCK_N, dtype=out.dtype)
+
+        for i in range(i_start, i_stop):
+            for j in range(n):
+                out[i, j] = 0
+
+        for p_start in range(0, k, BLOCK_K):
+            p_stop = min(p_start + BLOCK_K, k)
+
+            for j_start in range(0, n, BLOCK_N):
+                width = min(j_start + BLOCK_N, n) - j_start
+
+                for i in range(i_start, i_stop):
+                    acc[:width] = 0
+                    for p in range(p_start, p_stop):
+                        a = A[i, p]
+                        B_p = B[p, j_start:j_start + width]
+                        for j in range(width):
+                            acc[j] += a * B_p[j]
+
+                    for j in range(width):
+                        out[i, j_start + j] += acc[j]
+
+
+def _make_batched_matrix_mult(m, k, n):
+    """
+    Kernel for stacks of (m, k) @ (k, n) products, with the sizes fixed
+    at compile time so that the loops over each small product unroll,
+    and the stack split across threads.
+    """
+
+    @njit(parallel=True)
+    def batched_kernel(A, B, out):
+        for b in prange(A.shape[0]):
+            for i in range(m):
+                for j in range(n):
+                    acc = A[b, i, 0] * B[b, 0, j]
+                    for p in range(1, k):
+                        acc += A[b, i, p] * B[b, p, j]
+                    out[b, i, j] = acc
+
+    return batched_kernel
+
+
+_BATCHED_KERNELS = {}
+
+# the size-specialised kernel beats BLAS for stacks of matrices with
+# m * k * n up to about 343 (7 x 7), where the per-matrix overhead of
+# np.matmul dominates
+SMALL_PRODUCT = 343
+
+
+def batched_matrix_mult(A, B, out):
+    """
+    out[b] = A[b] @ B[b] for a stack of small matrices, using a kernel
+    compiled for the matrix sizes (once per sizes).  For many tiny
+    matrices this avoids the per-matrix overhead of A @ B.
+    """
+    m, k = A.shape[1:]
+    n = B.shape[2]
+
+    if k == 0:
+        out[...] = 0
+        return
+
+    if (m, k, n) not in _BATCHED_KERNELS:
+        _BATCHED_KERNELS[m, k, n] = _make_batched_matrix_mult(m, k, n)
+
+    _BATCHED_KERNELS[m, k, n](A, B, out)
+
+
+def matmul(A, B, out=None, stream=None, backend=None):
+    """
+    A @ B for 2-D arrays, or for stacks of matrices (3-D arrays with
+    the same number of matrices), with backend 'cuda' or 'cpu' - by
+    default the GPU if one is available.  On the CPU, stacks of small
+    matrices (m * k * n up to SMALL_PRODUCT) use batched_matrix_mult,
+    and everything else np.matmul, since BLAS is faster than
+    cpu_matrix_mult.
+
+    On the GPU, operands are staged through pooled pinned and device
+    buffers, and A is split into panels of PANEL_ROWS rows (or stacks
+    into chunks of about BATCH_ELEMENTS elements, each multiplied by one
+    launch) spread over N_STREAMS streams (or the given stream) so that
+    transfers overlap with computation.
+    """
+    if A.ndim != B.ndim or A.ndim not in (2, 3):
+        raise ValueError('A and B must both be 2 or both be 3 dimensional')
+
+    if backend is None:
+        backend = 'cuda' if cuda.is_available() else 'cpu'
+    elif backend not in ('cuda', 'cpu'):
+        raise ValueError("backend must be 'cuda', 'cpu' or None")
+
+    if A.shape[-1] != B.shape[-2] or A.shape[:-2] != B.shape[:-2]:
+        raise ValueError('A and B have incompatible shapes')
+
+    dtype = _result_dtype(A, B)
+    shape = A.shape[:-1] + (B.shape[-1],)
+
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape or out.dtype != dtype:
+        raise ValueError('out must have shape {} and dtype {}'.format(shape, dtype))
+
+    if out.size == 0:
+        return out
+
+    if A.shape[-1] == 0:
+        out[...] = 0
+        return out
+
+    A = A.astype(dtype, copy=False)
+    B = B.astype(dtype, copy=False)
+
+    if backend == 'cpu':
+        if A.ndim == 3 and A.shape[1] * A.shape[2] * B.shape[2] <= SMALL_PRODUCT:
+            batched_matrix_mult(A, B, out)
+        else:
+            np.matmul(A, B, out=out)
+        return out
+
+    streams = [stream] if stream is not None else [cuda.stream() for _ in range(N_STREAMS)]
+
+    if A.ndim == 2:
+        jobs = [(A[start:start + PANEL_ROWS], None, out[start:start + PANEL_ROWS])
+                for start in range(0, A.shape[0], PANEL_ROWS)]
+        _run_on_streams(jobs, B, dtype, streams)
+    else:
+        per_matrix = A[0].size + B[0].size + out[0].size
+        chunk = max(min(BATCH_ELEMENTS // per_matrix, MAX_GRID_Z), 1)
+        jobs = [(A[start:start + chunk], B[start:start + chunk], out[start:start + chunk])
+                for start in range(0, A.shape[0], chunk)]
+        _run_on_streams(jobs, None, dtype, streams)
+
+    return out
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main()
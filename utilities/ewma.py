@@ -1,49 +1,379 @@
 import numpy as np
 from numpy import empty
-from numba import jit
+from numba import jit, prange, float64, int64, boolean
+from numba.experimental import jitclass
 
 
-@jit(nopython=True)
-def ewma(data, alpha, adjust, ignore_na):
+@jit(nopython=True, cache=True)
+def _ewma_step(weighted_avg, old_wt, nobs, cur, old_wt_factor, new_wt, adjust, ignore_na, irregular=False):
+    """
+    Fold one value into the ewma state (weighted_avg, old_wt, nobs), with
+    the weight of the existing average decayed by old_wt_factor.  The state
+    before any values is (nan, 1., 0).  For irregular steps without
+    adjustment the new value takes whatever weight the average has lost.
+    """
+    is_observation = (cur == cur)
+    nobs += int(is_observation)
+    if weighted_avg == weighted_avg:
+
+        if is_observation or (not ignore_na):
+
+            old_wt *= old_wt_factor
+            if irregular and (not adjust):
+                new_wt = 1. - old_wt
+            if is_observation:
+
+                if weighted_avg != cur:
+                    weighted_avg = ((old_wt * weighted_avg) +
+                                    (new_wt * cur)) / (old_wt + new_wt)
+                if adjust:
+                    old_wt += new_wt
+                else:
+                    old_wt = 1.
+    elif is_observation:
+        weighted_avg = cur
+
+    return weighted_avg, old_wt, nobs
+
+
+@jit(nopython=True, cache=True)
+def _ewma_kernel(data, alpha, adjust, ignore_na, output):
 
     old_wt_factor = 1. - alpha
     new_wt = 1. if adjust else alpha
 
+    weighted_avg = np.nan
+    old_wt = 1.
+    nobs = 0
+
+    for i in range(data.shape[0]):
+        weighted_avg, old_wt, nobs = _ewma_step(weighted_avg, old_wt, nobs, data[i],
+                                                old_wt_factor, new_wt, adjust, ignore_na)
+        output[i] = weighted_avg if (nobs >= 1) else np.nan
+
+
+@jit(nopython=True, cache=True)
+def _ewma_times_kernel(data, times, halflife, adjust, ignore_na, output):
+    """
+    As _ewma_kernel, with the weight of the average halving every halflife
+    of time rather than decaying by a fixed factor per step.  As in pandas,
+    the decay of each step is 0.5 ** ((times[i] - times[i - 1]) / halflife).
+    """
+    new_wt = 1. if adjust else 0.5
+
+    weighted_avg = np.nan
+    old_wt = 1.
+    nobs = 0
+
+    for i in range(data.shape[0]):
+        old_wt_factor = 0.5 ** ((float(times[i]) - float(times[i - 1])) / halflife) if i > 0 else 1.
+        weighted_avg, old_wt, nobs = _ewma_step(weighted_avg, old_wt, nobs, data[i],
+                                                old_wt_factor, new_wt, adjust, ignore_na, True)
+        output[i] = weighted_avg if (nobs >= 1) else np.nan
+
+
+@jit(nopython=True, cache=True)
+def ewma(data, alpha, adjust, ignore_na):
+
     n = data.shape[0]
     output = empty(n)
 
-    weighted_avg = data[0]
-    is_observation = (weighted_avg == weighted_avg)
+    _ewma_kernel(data, alpha, adjust, ignore_na, output)
+
+    return output
+
+
+@jit(nopython=True, cache=True)
+def ewma_times(data, times, halflife, adjust, ignore_na):
+    """
+    ewma of irregularly spaced data, with int64 nanosecond timestamps and
+    the halflife in nanoseconds, as pandas' ewm(halflife=..., times=...).
+    """
+    if times.shape[0] != data.shape[0]:
+        raise ValueError('times must be the same length as data')
+
+    if not halflife > 0:
+        raise ValueError('halflife must be positive')
+
+    output = empty(data.shape[0])
+    _ewma_times_kernel(data, times, halflife, adjust, ignore_na, output)
+
+    return output
+
+
+@jitclass([
+    ('alpha', float64),
+    ('adjust', boolean),
+    ('ignore_na', boolean),
+    ('weighted_avg', float64),
+    ('old_wt', float64),
+    ('nobs', int64),
+])
+class EwmaAccumulator:
+    """
+    Resumable form of ewma, for data which arrives in chunks or one value
+    at a time.  Each value costs O(1), and the output is identical to that
+    of ewma over the concatenated data.
+    """
+
+    def __init__(self, alpha, adjust, ignore_na):
+        self.alpha = alpha
+        self.adjust = adjust
+        self.ignore_na = ignore_na
+        self.weighted_avg = np.nan
+        self.old_wt = 1.
+        self.nobs = 0
+
+    def push(self, value):
+        alpha = self.alpha
+        new_wt = 1. if self.adjust else alpha
+
+        self.weighted_avg, self.old_wt, self.nobs = _ewma_step(
+            self.weighted_avg, self.old_wt, self.nobs, value, 1. - alpha, new_wt, self.adjust, self.ignore_na)
+
+        return self.weighted_avg if (self.nobs >= 1) else np.nan
+
+    def update(self, data):
+        n = data.shape[0]
+        output = empty(n)
+
+        for i in range(n):
+            output[i] = self.push(data[i])
+
+        return output
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _ewma_2d(data, alphas, adjust, ignore_na):
+    """
+    ewma of each column of a 2-D array, with its own alpha, and the
+    columns distributed across threads.
+    """
+    n, m = data.shape
+    output = empty((n, m))
+
+    for j in prange(m):
+        _ewma_kernel(data[:, j], alphas[j], adjust, ignore_na, output[:, j])
+
+    return output
+
+
+def _column_alphas(alpha, n_columns):
+    alphas = np.asarray(alpha, dtype=np.float64)
+
+    if alphas.ndim == 0:
+        return np.full(n_columns, alphas.item())
+
+    if alphas.shape != (n_columns,):
+        raise ValueError('alpha must be a scalar or have one value per column')
+
+    return alphas
+
+
+def ewma_2d(data, alpha, adjust, ignore_na, axis=0):
+
+    if data.ndim != 2:
+        raise ValueError('data must be 2 dimensional')
+
+    if axis == 0:
+        return _ewma_2d(data, _column_alphas(alpha, data.shape[1]), adjust, ignore_na)
+    elif axis == 1:
+        return _ewma_2d(data.T, _column_alphas(alpha, data.shape[0]), adjust, ignore_na).T
+    else:
+        raise ValueError('axis must be either 0 or 1')
+
+
+@jit(nopython=True, cache=True)
+def _ewmcov_kernel(x, y, alpha, adjust, ignore_na, bias, output):
+    """
+    Exponentially weighted covariance of x and y, following pandas'
+    ewmcov: observations are the points where both x and y are present,
+    and unless bias is set the result carries pandas' bias correction
+    sum_wt ** 2 / (sum_wt ** 2 - sum_wt2).
+    """
+    old_wt_factor = 1. - alpha
+    new_wt = 1. if adjust else alpha
+
+    n = x.shape[0]
+
+    mean_x = x[0]
+    mean_y = y[0]
+    is_observation = (mean_x == mean_x) and (mean_y == mean_y)
     nobs = int(is_observation)
-    output[0] = weighted_avg if (nobs >= 1) else np.nan
+    if not is_observation:
+        mean_x = np.nan
+        mean_y = np.nan
+    output[0] = (0. if bias else np.nan) if (nobs >= 1) else np.nan
+
+    cov = 0.
+    sum_wt = 1.
+    sum_wt2 = 1.
     old_wt = 1.
 
     for i in range(1, n):
-        cur = data[i]
-        is_observation = (cur == cur)
+        cur_x = x[i]
+        cur_y = y[i]
+        is_observation = (cur_x == cur_x) and (cur_y == cur_y)
         nobs += int(is_observation)
-        if weighted_avg == weighted_avg:
+        if mean_x == mean_x:
 
             if is_observation or (not ignore_na):
 
+                sum_wt *= old_wt_factor
+                sum_wt2 *= (old_wt_factor * old_wt_factor)
                 old_wt *= old_wt_factor
                 if is_observation:
 
-                    if weighted_avg != cur:
-                        weighted_avg = ((old_wt * weighted_avg) +
-                                        (new_wt * cur)) / (old_wt + new_wt)
-                    if adjust:
-                        old_wt += new_wt
-                    else:
+                    old_mean_x = mean_x
+                    old_mean_y = mean_y
+                    if mean_x != cur_x:
+                        mean_x = ((old_wt * old_mean_x) +
+                                  (new_wt * cur_x)) / (old_wt + new_wt)
+                    if mean_y != cur_y:
+                        mean_y = ((old_wt * old_mean_y) +
+                                  (new_wt * cur_y)) / (old_wt + new_wt)
+                    cov = ((old_wt * (cov + ((old_mean_x - mean_x) *
+                                             (old_mean_y - mean_y)))) +
+                           (new_wt * ((cur_x - mean_x) *
+                                      (cur_y - mean_y)))) / (old_wt + new_wt)
+                    sum_wt += new_wt
+                    sum_wt2 += (new_wt * new_wt)
+                    old_wt += new_wt
+                    if not adjust:
+                        sum_wt /= old_wt
+                        sum_wt2 /= (old_wt * old_wt)
                         old_wt = 1.
         elif is_observation:
-            weighted_avg = cur
+            mean_x = cur_x
+            mean_y = cur_y
+
+        if nobs >= 1:
+            if bias:
+                output[i] = cov
+            else:
+                numerator = sum_wt * sum_wt
+                denominator = numerator - sum_wt2
+                output[i] = (numerator / denominator) * cov if denominator > 0 else np.nan
+        else:
+            output[i] = np.nan
 
-        output[i] = weighted_avg if (nobs >= 1) else np.nan
+
+@jit(nopython=True, error_model='numpy', cache=True)
+def _ewmcorr_kernel(x, y, alpha, adjust, ignore_na, output, scratch):
+    """
+    Exponentially weighted correlation, as pandas computes it: the biased
+    covariance over the biased variances, all on the points where both x
+    and y are present.
+    """
+    x_masked = x + 0. * y
+    y_masked = y + 0. * x
+
+    x_var = scratch[:, 0]
+    y_var = scratch[:, 1]
+    _ewmcov_kernel(x_masked, y_masked, alpha, adjust, ignore_na, True, output)
+    _ewmcov_kernel(x_masked, x_masked, alpha, adjust, ignore_na, True, x_var)
+    _ewmcov_kernel(y_masked, y_masked, alpha, adjust, ignore_na, True, y_var)
+
+    for i in range(x.shape[0]):
+        output[i] /= np.sqrt(max(x_var[i] * y_var[i], 0.))
+
+
+@jit(nopython=True, cache=True)
+def ewmcov(x, y, alpha, adjust, ignore_na, bias=False):
+
+    output = empty(x.shape[0])
+    _ewmcov_kernel(x, y, alpha, adjust, ignore_na, bias, output)
 
     return output
 
 
+@jit(nopython=True, cache=True)
+def ewmvar(data, alpha, adjust, ignore_na, bias=False):
+    return ewmcov(data, data, alpha, adjust, ignore_na, bias)
+
+
+@jit(nopython=True, cache=True)
+def ewmstd(data, alpha, adjust, ignore_na, bias=False):
+    return np.sqrt(np.maximum(ewmvar(data, alpha, adjust, ignore_na, bias), 0.))
+
+
+@jit(nopython=True, cache=True)
+def ewmcorr(x, y, alpha, adjust, ignore_na):
+
+    n = x.shape[0]
+    output = empty(n)
+    _ewmcorr_kernel(x, y, alpha, adjust, ignore_na, output, empty((n, 2)))
+
+    return output
+
+
+@jit(nopython=True, cache=True)
+def _pair_from_index(p, k):
+    # the p'th pair (i, j), i <= j, of k columns, in row-major order
+    i = 0
+    while p >= k - i:
+        p -= k - i
+        i += 1
+
+    return i, i + p
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _ewm_pairwise(data, alpha, adjust, ignore_na, bias, correlation, latest):
+    """
+    Pairwise ewmcov (or ewmcorr) of the columns of data, with the pairs
+    distributed across threads.  Each pair is a single pass over the rows.
+    """
+    n, k = data.shape
+    n_pairs = k * (k + 1) // 2
+
+    n_out = 1 if latest else n
+    output = empty((n_out, k, k))
+
+    for p in prange(n_pairs):
+        i, j = _pair_from_index(np.int64(p), k)
+
+        pair_output = empty(n)
+        if correlation:
+            _ewmcorr_kernel(data[:, i], data[:, j], alpha, adjust, ignore_na, pair_output, empty((n, 2)))
+        else:
+            _ewmcov_kernel(data[:, i], data[:, j], alpha, adjust, ignore_na, bias, pair_output)
+
+        if latest:
+            output[0, i, j] = pair_output[n - 1]
+            output[0, j, i] = pair_output[n - 1]
+        else:
+            output[:, i, j] = pair_output
+            output[:, j, i] = pair_output
+
+    return output
+
+
+def ewmcov_matrix(data, alpha, adjust, ignore_na, bias=False, latest=False):
+    """
+    Exponentially weighted covariance matrices of the columns of an (n, k)
+    array: an (n, k, k) array, or just the latest (k, k) matrix.
+    """
+    if data.ndim != 2:
+        raise ValueError('data must be 2 dimensional')
+
+    output = _ewm_pairwise(data, alpha, adjust, ignore_na, bias, False, latest)
+
+    return output[0] if latest else output
+
+
+def ewmcorr_matrix(data, alpha, adjust, ignore_na, latest=False):
+    """
+    As ewmcov_matrix, for correlations.
+    """
+    if data.ndim != 2:
+        raise ValueError('data must be 2 dimensional')
+
+    output = _ewm_pairwise(data, alpha, adjust, ignore_na, True, True, latest)
+
+    return output[0] if latest else output
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main()
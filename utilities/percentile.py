@@ -1,24 +1,172 @@
 import math
 
 import numpy as np
-from numba import types
+from numba import errors, njit, prange, types
+from numba.cpython.unsafe.tuple import tuple_setitem
 from numba.extending import overload, register_jitable
+from numba.np.unsafe.ndarray import to_fixed_tuple
+
+
+_LINEAR, _LOWER, _HIGHER, _NEAREST, _MIDPOINT = range(5)
+
+_METHODS = {
+    'linear': _LINEAR,
+    'lower': _LOWER,
+    'higher': _HIGHER,
+    'nearest': _NEAREST,
+    'midpoint': _MIDPOINT,
+}
 
 
 @register_jitable
-def _collect_percentiles(a, q, skip_nan=False):
-    a_sorted = np.sort(a.flatten())
-
-    if skip_nan:
-        nan_mask = np.isnan(a_sorted)
-        a_sorted = a_sorted[~nan_mask]
-        if len(a_sorted) == 0:
-            return np.full(len(q), np.nan)
+def _linear_rank(n, percentile):
+    """
+    Zero-based index of the order statistic at or below the requested
+    percentile of n sorted values, and the fraction of the distance to
+    the next order statistic at which the percentile lies.
+    """
+    rank = 1 + (n - 1) * percentile / 100
+    f = math.floor(rank)
+    return f - 1, rank - f
+
+
+@register_jitable
+def _method_rank(n, percentile, method):
+    """
+    As _linear_rank, for any of the interpolation methods in _METHODS.
+    """
+    if percentile == 0:
+        return 0, 0.
+
+    if percentile == 100:
+        return n - 1, 0.
+
+    if method == _LINEAR:
+        return _linear_rank(n, percentile)
+
+    # as numpy, which divides first: the two differ in rounding where the
+    # index should be a whole number
+    virtual_index = (n - 1) * (percentile / 100)
+    f = math.floor(virtual_index)
+    gamma = virtual_index - f
+
+    if method == _LOWER:
+        return f, 0.
+    elif method == _HIGHER:
+        return (f + 1, 0.) if gamma > 0 else (f, 0.)
+    elif method == _NEAREST:
+        # ties go to the even index, as with np.around
+        if gamma > 0.5 or (gamma == 0.5 and f % 2 == 1):
+            return f + 1, 0.
+        return f, 0.
     else:
-        if np.any(np.isnan(a_sorted)):
-            return np.full(len(q), np.nan)
+        return f, 0.5 if gamma > 0 else 0.
+
+
+@register_jitable
+def _swap(a, i, j):
+    tmp = a[i]
+    a[i] = a[j]
+    a[j] = tmp
+
+
+@register_jitable
+def _partition_select(a, lo, hi, k):
+    """
+    Reorder a[lo:hi + 1] in place so that a[k] holds the value it would
+    hold were the slice sorted, with nothing larger before it and nothing
+    smaller after it.  Hoare's selection with median-of-three pivots,
+    which falls back to sorting the remaining slice if the partitions
+    keep coming out lopsided (as in numpy's introselect).
+    """
+    depth_limit = 2 * int(math.log2(hi - lo + 1)) + 4
+
+    while hi > lo:
+        if depth_limit == 0:
+            a[lo:hi + 1].sort()
+            return
+        depth_limit -= 1
 
-    out = np.empty(len(q))
+        mid = (lo + hi) // 2
+        if a[mid] < a[lo]:
+            _swap(a, lo, mid)
+        if a[hi] < a[lo]:
+            _swap(a, lo, hi)
+        if a[hi] < a[mid]:
+            _swap(a, mid, hi)
+        pivot = a[mid]
+
+        i = lo
+        j = hi
+        while i <= j:
+            while a[i] < pivot:
+                i += 1
+            while a[j] > pivot:
+                j -= 1
+            if i <= j:
+                _swap(a, i, j)
+                i += 1
+                j -= 1
+
+        if k <= j:
+            hi = j
+        elif k >= i:
+            lo = i
+        else:
+            return
+
+
+@register_jitable
+def _multi_select(a, kth):
+    """
+    Apply _partition_select for each of the sorted, unique ranks in kth.
+    Each rank is selected within the slice bounded by the ranks already
+    placed either side of it, so the work is linear in len(a) rather
+    than that of a full sort.
+    """
+    stack = np.empty((2 * len(kth) + 2, 4), dtype=np.int64)
+    stack[0, 0] = 0
+    stack[0, 1] = len(a) - 1
+    stack[0, 2] = 0
+    stack[0, 3] = len(kth) - 1
+    top = 1
+
+    while top > 0:
+        top -= 1
+        lo, hi, k_lo, k_hi = stack[top, 0], stack[top, 1], stack[top, 2], stack[top, 3]
+
+        if k_lo > k_hi:
+            continue
+
+        k_mid = (k_lo + k_hi) // 2
+        k = kth[k_mid]
+        _partition_select(a, lo, hi, k)
+
+        stack[top, 0] = lo
+        stack[top, 1] = k - 1
+        stack[top, 2] = k_lo
+        stack[top, 3] = k_mid - 1
+        stack[top + 1, 0] = k + 1
+        stack[top + 1, 1] = hi
+        stack[top + 1, 2] = k_mid + 1
+        stack[top + 1, 3] = k_hi
+        top += 2
+
+
+@register_jitable
+def _select_percentiles(values, q, method=_LINEAR):
+    """
+    Percentiles of the (NaN-free, non-empty) 1-D array values, which is
+    reordered in place.  Only the order statistics which the requested
+    percentiles need are found.
+    """
+    n = len(values)
+    nq = len(q)
+
+    lower = np.empty(nq, dtype=np.int64)
+    fraction = np.empty(nq)
+    kth = np.empty(2 * nq, dtype=np.int64)
+    n_kth = 0
     i = 0
 
     for v in np.nditer(q):
@@ -26,40 +174,297 @@ def _collect_percentiles(a, q, skip_nan=False):
         if percentile < 0 or percentile > 100 or np.isnan(percentile):
             raise ValueError("Percentiles must be in the range [0,100]")
 
-        if percentile == 0:
-            val = a_sorted[0]
-        elif percentile == 100:
-            val = a_sorted[-1]
-        else:
-            rank = 1 + (len(a_sorted) - 1) * percentile / 100
-            f = math.floor(rank)
-            m = rank - f
-            prior_val = a_sorted[f - 1]
-            val = prior_val + m * (a_sorted[f] - prior_val)
-        out[i] = val
+        f, m = _method_rank(n, percentile, method)
+
+        lower[i] = f
+        fraction[i] = m
+        kth[n_kth] = f
+        n_kth += 1
+        if m > 0:
+            kth[n_kth] = f + 1
+            n_kth += 1
         i += 1
 
+    _multi_select(values, np.unique(kth[:n_kth]))
+
+    out = np.empty(nq)
+
+    for i in range(nq):
+        prior_val = values[lower[i]]
+        m = fraction[i]
+        if m > 0:
+            out[i] = prior_val + m * (values[lower[i] + 1] - prior_val)
+        else:
+            out[i] = prior_val
+
+    return out
+
+
+@register_jitable
+def _collect_percentiles(a, q, skip_nan=False, method=_LINEAR):
+    values = np.empty(a.size, dtype=a.dtype)
+    n = 0
+
+    for v in a.flat:
+        if np.isnan(v):
+            if not skip_nan:
+                return np.full(len(q), np.nan)
+        else:
+            values[n] = v
+            n += 1
+
+    if n == 0:
+        return np.full(len(q), np.nan)
+
+    return _select_percentiles(values[:n], q, method)
+
+
+@register_jitable
+def _lane_start(shape, kept_dims, reduced_dims, lane):
+    """
+    Index of the first element of a lane, given its position in C order.
+    """
+    idx = shape
+    for j in range(len(kept_dims) - 1, -1, -1):
+        d = kept_dims[j]
+        idx = tuple_setitem(idx, d, lane % shape[d])
+        lane //= shape[d]
+    for d in reduced_dims:
+        idx = tuple_setitem(idx, d, 0)
+    return idx
+
+
+@njit(parallel=True, cache=True)
+def _lane_percentiles(a, q, reduced, skip_nan, method):
+    """
+    Percentiles of each lane of a, where a lane is the set of elements
+    sharing an index along the dimensions which are not reduced.  Each
+    lane is gathered straight from a, which may be any strided view, into
+    its own scratch buffer, and lanes are processed in parallel.  Returns
+    an array of shape (len(q), number of lanes), lanes in C order.
+    """
+    for v in np.nditer(q):
+        percentile = v.item()
+        if percentile < 0 or percentile > 100 or np.isnan(percentile):
+            raise ValueError("Percentiles must be in the range [0,100]")
+
+    kept_dims = np.nonzero(~reduced)[0]
+    reduced_dims = np.nonzero(reduced)[0]
+
+    n_lanes = 1
+    for d in kept_dims:
+        n_lanes *= a.shape[d]
+
+    lane_len = 1
+    for d in reduced_dims:
+        lane_len *= a.shape[d]
+
+    out = np.empty((len(q), n_lanes))
+
+    for lane in prange(n_lanes):
+        idx = _lane_start(a.shape, kept_dims, reduced_dims, lane)
+        values = np.empty(lane_len, dtype=a.dtype)
+        n = 0
+        has_nan = False
+
+        for _ in range(lane_len):
+            v = a[idx]
+            if np.isnan(v):
+                has_nan = True
+            else:
+                values[n] = v
+                n += 1
+
+            # advance the index over the reduced dimensions, odometer style
+            for j in range(len(reduced_dims) - 1, -1, -1):
+                d = reduced_dims[j]
+                if idx[d] + 1 < a.shape[d]:
+                    idx = tuple_setitem(idx, d, idx[d] + 1)
+                    break
+                idx = tuple_setitem(idx, d, 0)
+
+        if n == 0 or (has_nan and not skip_nan):
+            out[:, lane] = np.nan
+        else:
+            out[:, lane] = _select_percentiles(values[:n], q, method)
+
     return out
 
 
-@overload(np.percentile)
-def np_percentile(a, q):
+def _reduced_dims(axis, ndim):
+    pass
+
 
-    def np_percentile_q_scalar_impl(a, q):
+@overload(_reduced_dims)
+def _reduced_dims_impl(axis, ndim):
+
+    def reduce_all_impl(axis, ndim):
+        return np.ones(ndim, dtype=np.bool_)
+
+    def reduce_one_impl(axis, ndim):
+        reduced = np.zeros(ndim, dtype=np.bool_)
+        d = axis + ndim if axis < 0 else axis
+        if d < 0 or d >= ndim:
+            raise ValueError('axis is out of bounds for array')
+        reduced[d] = True
+        return reduced
+
+    def reduce_many_impl(axis, ndim):
+        reduced = np.zeros(ndim, dtype=np.bool_)
+        for ax in axis:
+            d = ax + ndim if ax < 0 else ax
+            if d < 0 or d >= ndim:
+                raise ValueError('axis is out of bounds for array')
+            if reduced[d]:
+                raise ValueError('repeated axis')
+            reduced[d] = True
+        return reduced
+
+    if _is_none(axis):
+        return reduce_all_impl
+    elif isinstance(axis, types.Integer):
+        return reduce_one_impl
+    elif isinstance(axis, types.UniTuple) and isinstance(axis.dtype, types.Integer):
+        return reduce_many_impl
+
+
+def _as_percentile_array(q):
+    pass
+
+
+@overload(_as_percentile_array)
+def _as_percentile_array_impl(q):
+
+    if isinstance(q, (types.Float, types.Integer)):
+        return lambda q: np.array([q], dtype=np.float64)
+    elif isinstance(q, types.BaseTuple):
+        return lambda q: np.array(q, dtype=np.float64)
+    elif isinstance(q, types.Array):
+        return lambda q: q.astype(np.float64).ravel()
+
+
+def _is_none(arg):
+    return arg is None or isinstance(arg, types.NoneType) or (
+        isinstance(arg, types.Omitted) and arg.value is None)
+
+
+def _literal_keepdims(keepdims):
+    if isinstance(keepdims, types.Omitted):
+        return bool(keepdims.value)
+    if isinstance(keepdims, (types.BooleanLiteral, types.IntegerLiteral)):
+        return bool(keepdims.literal_value)
+    if isinstance(keepdims, bool):
+        return keepdims
+    raise errors.TypingError('keepdims must be a compile-time constant')
+
+
+def _literal_method(method):
+    if isinstance(method, types.Omitted):
+        name = method.value
+    elif isinstance(method, types.StringLiteral):
+        name = method.literal_value
+    elif isinstance(method, str):
+        name = method
+    else:
+        raise errors.TypingError('method must be a compile-time constant')
+
+    if name not in _METHODS:
+        raise ValueError('method must be one of {}'.format(', '.join(sorted(_METHODS))))
+
+    return _METHODS[name]
+
+
+def _percentile_along_axis(a, q, axis, keepdims, method, skip_nan):
+    """
+    Implementation of np.percentile / np.nanpercentile for calls which
+    supply axis or keepdims.  The dimensionality of the result has to be
+    known when typing, hence keepdims must be a compile-time constant.
+    """
+    if not isinstance(a, types.Array):
+        raise errors.TypingError('a must be an array')
+
+    if not isinstance(q, (types.Float, types.Integer, types.BaseTuple, types.Array)):
+        raise ValueError('q must be scalar, tuple or np.array')
+
+    if _is_none(axis):
+        n_axes = a.ndim
+    elif isinstance(axis, types.Integer):
+        n_axes = 1
+    elif isinstance(axis, types.UniTuple) and isinstance(axis.dtype, types.Integer):
+        n_axes = axis.count
+    else:
+        raise errors.TypingError('axis must be None, an integer or a tuple of integers')
+
+    keep = _literal_keepdims(keepdims)
+    method_code = _literal_method(method)
+    out_ndim = a.ndim if keep else a.ndim - n_axes
+    q_out_ndim = out_ndim + 1
+
+    @register_jitable
+    def lane_shape(a, reduced):
+        shape = np.empty(out_ndim, dtype=np.int64)
+        j = 0
+        for d in range(a.ndim):
+            if not reduced[d]:
+                shape[j] = a.shape[d]
+                j += 1
+            elif keep:
+                shape[j] = 1
+                j += 1
+        return shape
+
+    def q_scalar_to_scalar_impl(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
+        reduced = _reduced_dims(axis, a.ndim)
+        return _lane_percentiles(a, _as_percentile_array(q), reduced, skip_nan, method_code)[0, 0]
+
+    def q_scalar_impl(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
+        reduced = _reduced_dims(axis, a.ndim)
+        out = _lane_percentiles(a, _as_percentile_array(q), reduced, skip_nan, method_code)
+        return out[0].reshape(to_fixed_tuple(lane_shape(a, reduced), out_ndim))
+
+    def q_array_impl(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
+        reduced = _reduced_dims(axis, a.ndim)
+        qs = _as_percentile_array(q)
+        out = _lane_percentiles(a, qs, reduced, skip_nan, method_code)
+        shape = np.empty(q_out_ndim, dtype=np.int64)
+        shape[0] = len(qs)
+        shape[1:] = lane_shape(a, reduced)
+        return out.reshape(to_fixed_tuple(shape, q_out_ndim))
+
+    if isinstance(q, (types.Float, types.Integer)):
+        return q_scalar_to_scalar_impl if out_ndim == 0 else q_scalar_impl
+
+    return q_array_impl
+
+
+@overload(np.percentile, prefer_literal=True)
+def np_percentile(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
+
+    # as numpy's signature, so that positional arguments mean the same;
+    # the result is always a new array, and the input is never modified
+    if not _is_none(out):
+        raise errors.TypingError('out is not supported')
+
+    if not _is_none(axis) or _literal_keepdims(keepdims):
+        return _percentile_along_axis(a, q, axis, keepdims, method, skip_nan=False)
+
+    method_code = _literal_method(method)
+
+    def np_percentile_q_scalar_impl(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
         q = np.array([q])
-        return _collect_percentiles(a, q)[0]
+        return _collect_percentiles(a, q, method=method_code)[0]
 
-    def np_percentile_q_array_impl(a, q):
-        return _collect_percentiles(a, q)
+    def np_percentile_q_array_impl(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
+        return _collect_percentiles(a, q, method=method_code)
 
-    def np_percentile_q_tuple_impl(a, q):
+    def np_percentile_q_tuple_impl(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
         q = np.array(q)
-        return _collect_percentiles(a, q)
+        return _collect_percentiles(a, q, method=method_code)
 
     if isinstance(q, (types.Float, types.Integer)):
         fn = np_percentile_q_scalar_impl
 
-    elif isinstance(q, (types.Tuple)):
+    elif isinstance(q, (types.BaseTuple)):
         fn = np_percentile_q_tuple_impl
 
     elif isinstance(q, types.Array):
@@ -71,24 +476,34 @@ def np_percentile(a, q):
     return fn
 
 
-@overload(np.nanpercentile)
-def np_nanpercentile(a, q):
+@overload(np.nanpercentile, prefer_literal=True)
+def np_nanpercentile(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
+
+    # as numpy's signature, so that positional arguments mean the same;
+    # the result is always a new array, and the input is never modified
+    if not _is_none(out):
+        raise errors.TypingError('out is not supported')
 
-    def np_nanpercentile_q_scalar_impl(a, q):
+    if not _is_none(axis) or _literal_keepdims(keepdims):
+        return _percentile_along_axis(a, q, axis, keepdims, method, skip_nan=True)
+
+    method_code = _literal_method(method)
+
+    def np_nanpercentile_q_scalar_impl(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
         q = np.array([q])
-        return _collect_percentiles(a, q, skip_nan=True)[0]
+        return _collect_percentiles(a, q, skip_nan=True, method=method_code)[0]
 
-    def np_nanpercentile_q_array_impl(a, q):
-        return _collect_percentiles(a, q, skip_nan=True)
+    def np_nanpercentile_q_array_impl(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
+        return _collect_percentiles(a, q, skip_nan=True, method=method_code)
 
-    def np_nanpercentile_q_tuple_impl(a, q):
+    def np_nanpercentile_q_tuple_impl(a, q, axis=None, out=None, overwrite_input=False, method='linear', keepdims=False):
         q = np.array(q)
-        return _collect_percentiles(a, q, skip_nan=True)
+        return _collect_percentiles(a, q, skip_nan=True, method=method_code)
 
     if isinstance(q, (types.Float, types.Integer)):
         fn = np_nanpercentile_q_scalar_impl
 
-    elif isinstance(q, (types.Tuple)):
+    elif isinstance(q, (types.BaseTuple)):
         fn = np_nanpercentile_q_tuple_impl
 
     elif isinstance(q, types.Array):
@@ -98,3 +513,63 @@ def np_nanpercentile(a, q):
         raise ValueError('q must be scalar, tuple or np.array')
 
     return fn
+
+
+def _unwrap_percentiles(out, q):
+    pass
+
+
+@overload(_unwrap_percentiles)
+def _unwrap_percentiles_impl(out, q):
+
+    if isinstance(q, (types.Float, types.Integer)):
+        return lambda out, q: out[0]
+
+    return lambda out, q: out
+
+
+@njit(cache=True)
+def weighted_percentile(a, w, q):
+    """
+    Percentiles of a where each value carries the weight at the same
+    position in w.  The percentile is the smallest value at which the
+    cumulative weight reaches q% of the total weight, which matches
+    np.percentile(a, q, weights=w, method='inverted_cdf').  The values
+    are sorted once, however many percentiles are requested.
+    """
+    values = a.ravel()
+    weights = w.ravel()
+
+    if values.shape != weights.shape:
+        raise ValueError('a and w must have the same shape')
+
+    qs = _as_percentile_array(q)
+
+    for percentile in qs:
+        if percentile < 0 or percentile > 100 or np.isnan(percentile):
+            raise ValueError("Percentiles must be in the range [0,100]")
+
+    for weight in weights:
+        if not weight >= 0:
+            raise ValueError('weights must be non-negative')
+
+    out = np.full(len(qs), np.nan)
+
+    if len(values) == 0 or np.any(np.isnan(values)):
+        return _unwrap_percentiles(out, q)
+
+    order = np.argsort(values)
+    cdf = np.cumsum(weights[order].astype(np.float64))
+
+    if cdf[-1] == 0:
+        raise ValueError('weights must not sum to zero')
+
+    cdf /= cdf[-1]
+    # as numpy, so that values with zero weight at the start are never chosen
+    cdf[cdf == 0] = -1.
+    index = np.searchsorted(cdf, qs / 100)
+
+    for i in range(len(qs)):
+        out[i] = values[order[min(index[i], len(values) - 1)]]
+
+    return _unwrap_percentiles(out, q)
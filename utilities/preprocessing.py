@@ -1,38 +1,403 @@
 import numpy as np
-from numba import jit
+from numba import jit, prange
 
+import utilities.percentile as perc
+from utilities.rank_data import rank_data
 
-@jit(nopython=True)
-def standard_scale(data, ddof=0):
+_ = perc  # registers the np.nanpercentile overload
+
+
+@jit(nopython=True, cache=True)
+def _welford(x):
+    # one pass mean and sum of squared deviations
+    mean = 0.
+    m2 = 0.
+
+    for i in range(x.shape[0]):
+        delta = x[i] - mean
+        mean += delta / (i + 1)
+        m2 += delta * (x[i] - mean)
+
+    return mean, m2
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _column_moments(data):
+
+    n = data.shape[1]
+    means = np.empty(n)
+    m2s = np.empty(n)
+
+    for i in prange(n):
+        means[i], m2s[i] = _welford(data[:, i])
+
+    return means, m2s
+
+
+@jit(nopython=True, cache=True)
+def _nan_welford(x):
+    # as _welford, skipping NaNs
+    count = 0
+    mean = 0.
+    m2 = 0.
+
+    for i in range(x.shape[0]):
+        if np.isnan(x[i]):
+            continue
+
+        count += 1
+        delta = x[i] - mean
+        mean += delta / count
+        m2 += delta * (x[i] - mean)
+
+    return count, mean, m2
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _column_nan_moments(data):
+
+    n = data.shape[1]
+    counts = np.empty(n, dtype=np.int64)
+    means = np.empty(n)
+    m2s = np.empty(n)
+
+    for i in prange(n):
+        counts[i], means[i], m2s[i] = _nan_welford(data[:, i])
+
+    return counts, means, m2s
+
+
+@jit(nopython=True, cache=True)
+def _min_max(x):
+    # one pass minimum and maximum, NaN if there are any NaNs, as np.min
+    if x.shape[0] == 0:
+        raise ValueError('zero-size array to reduction operation not allowed')
+
+    lowest = highest = x[0]
+
+    for i in range(x.shape[0]):
+        if np.isnan(x[i]):
+            return np.nan, np.nan
+
+        if x[i] < lowest:
+            lowest = x[i]
+        elif x[i] > highest:
+            highest = x[i]
+
+    return lowest, highest
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _column_min_max(data):
+
+    n = data.shape[1]
+    mins = np.empty(n)
+    maxs = np.empty(n)
 
+    for i in prange(n):
+        mins[i], maxs[i] = _min_max(data[:, i])
+
+    return mins, maxs
+
+
+@jit(nopython=True, cache=True)
+def standard_scale_fit(data, ddof=0):
+    """
+    Per-column mean and standard deviation, for scale_transform.
+    """
     if ddof not in (0, 1):
         raise ValueError('ddof must be either 0 or 1')
 
+    means, m2s = _column_moments(data)
+
+    return means, np.sqrt(m2s / (data.shape[0] - ddof))
+
+
+@jit(nopython=True, cache=True)
+def _nan_min_max(x):
+    # as _min_max, skipping NaNs, and NaN if there are only NaNs
+    if x.shape[0] == 0:
+        raise ValueError('zero-size array to reduction operation not allowed')
+
+    count = 0
+    lowest = highest = np.nan
+
+    for i in range(x.shape[0]):
+        if np.isnan(x[i]):
+            continue
+
+        if count == 0:
+            lowest = highest = x[i]
+        elif x[i] < lowest:
+            lowest = x[i]
+        elif x[i] > highest:
+            highest = x[i]
+
+        count += 1
+
+    return lowest, highest
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _column_nan_min_max(data):
+
     n = data.shape[1]
-    res = np.empty_like(data)
-    data_t = data.T
+    mins = np.empty(n)
+    maxs = np.empty(n)
 
-    for i in range(n):
-        data_i = data_t[i, :]
-        res[:, i] = (data_i - np.mean(data_i)) / np.std(data_i)
+    for i in prange(n):
+        mins[i], maxs[i] = _nan_min_max(data[:, i])
 
-    if ddof == 0:
-        return res
-    elif ddof == 1:
-        m = data.shape[0]
-        return res * np.sqrt((m - 1) / m)
+    return mins, maxs
 
 
-@jit(nopython=True)
-def min_max_scale(data):
+@jit(nopython=True, parallel=True, cache=True)
+def _column_nan_percentiles(data, q):
 
     n = data.shape[1]
-    res = np.empty_like(data)
-    data_t = data.T
+    res = np.empty((q.shape[0], n))
+
+    for i in prange(n):
+        res[:, i] = np.nanpercentile(data[:, i], q)
+
+    return res
+
+
+@jit(nopython=True, cache=True)
+def nan_standard_scale_fit(data, ddof=0):
+    """
+    As standard_scale_fit, ignoring NaNs.
+    """
+    if ddof not in (0, 1):
+        raise ValueError('ddof must be either 0 or 1')
+
+    counts, means, m2s = _column_nan_moments(data)
+
+    return means, np.sqrt(m2s / (counts - ddof))
+
+
+@jit(nopython=True, cache=True)
+def min_max_scale_fit(data):
+    """
+    Per-column minimum and range, for scale_transform.
+    """
+    mins, maxs = _column_min_max(data)
+
+    return mins, maxs - mins
+
+
+@jit(nopython=True, cache=True)
+def nan_min_max_scale_fit(data):
+    """
+    As min_max_scale_fit, ignoring NaNs.
+    """
+    mins, maxs = _column_nan_min_max(data)
+
+    return mins, maxs - mins
+
+
+@jit(nopython=True, cache=True)
+def robust_scale_fit(data, lower=25., upper=75.):
+    """
+    Per-column median and the range between the lower and upper
+    percentiles (by default the interquartile range), ignoring NaNs.
+    """
+    if not 0 <= lower <= upper <= 100:
+        raise ValueError('Percentiles must satisfy 0 <= lower <= upper <= 100')
+
+    q = np.array([50., lower, upper])
+    percentiles = _column_nan_percentiles(data, q)
+
+    return percentiles[0], percentiles[2] - percentiles[1]
+
+
+@jit(nopython=True, parallel=True, error_model='numpy', cache=True)
+def _scale_transform(data, loc, scale, out):
+
+    m, n = data.shape
+
+    for i in prange(m):
+        for j in range(n):
+            out[i, j] = (data[i, j] - loc[j]) / scale[j]
+
+
+@jit(nopython=True, cache=True)
+def scale_transform(data, loc, scale, out=None):
+    """
+    (data - loc) / scale for each column, written to out if given (which
+    may be data itself) or else to a new array.
+    """
+    if loc.shape[0] != data.shape[1] or scale.shape[0] != data.shape[1]:
+        raise ValueError('loc and scale must have one value per column')
+
+    if out is None:
+        res = np.empty_like(data)
+    else:
+        if out.shape != data.shape:
+            raise ValueError('out must have the same shape as data')
+        res = out
+
+    _scale_transform(data, loc, scale, res)
+
+    return res
+
+
+@jit(nopython=True, cache=True)
+def _combine_moments(count_a, means_a, m2s_a, count_b, means_b, m2s_b):
+    # Chan et al.'s pairwise update for the moments of two row blocks
+    count = count_a + count_b
+    delta = means_b - means_a
+
+    means = means_a + delta * (count_b / count)
+    m2s = m2s_a + m2s_b + delta ** 2 * (count_a * count_b / count)
+
+    return count, means, m2s
+
+
+def row_blocks(data, block_size):
+    """
+    Successive blocks of block_size rows of data, as views, so that a
+    np.memmap is only read a block at a time.
+    """
+    if block_size < 1:
+        raise ValueError('block_size must be positive')
+
+    for start in range(0, data.shape[0], block_size):
+        yield np.asarray(data[start:start + block_size])
+
+
+def standard_scale_fit_chunked(blocks, ddof=0):
+    """
+    As standard_scale_fit, for data given as an iterable of row blocks
+    (for example row_blocks of a np.memmap), holding one block at a time.
+    """
+    if ddof not in (0, 1):
+        raise ValueError('ddof must be either 0 or 1')
+
+    count = 0
+    means = m2s = None
+
+    for block in blocks:
+        block_means, block_m2s = _column_moments(block)
+        if count == 0:
+            count, means, m2s = block.shape[0], block_means, block_m2s
+        else:
+            count, means, m2s = _combine_moments(count, means, m2s, block.shape[0], block_means, block_m2s)
+
+    if count == 0:
+        raise ValueError('no data to fit')
+
+    return means, np.sqrt(m2s / (count - ddof))
+
+
+def min_max_scale_fit_chunked(blocks):
+    """
+    As min_max_scale_fit, for data given as an iterable of row blocks.
+    """
+    mins = maxs = None
+
+    for block in blocks:
+        block_mins, block_maxs = _column_min_max(block)
+        if mins is None:
+            mins, maxs = block_mins, block_maxs
+        else:
+            mins, maxs = np.minimum(mins, block_mins), np.maximum(maxs, block_maxs)
+
+    if mins is None:
+        raise ValueError('no data to fit')
+
+    return mins, maxs - mins
+
+
+def scale_transform_chunked(data, loc, scale, out, block_size):
+    """
+    scale_transform of data into out, a block of rows at a time, so that
+    both may be memory-mapped arrays larger than memory.
+    """
+    if out.shape != data.shape:
+        raise ValueError('out must have the same shape as data')
+
+    for start in range(0, data.shape[0], block_size):
+        stop = start + block_size
+        scale_transform(np.asarray(data[start:stop]), loc, scale, np.asarray(out[start:stop]))
+
+    return out
+
+
+@jit(nopython=True, cache=True)
+def standard_scale(data, ddof=0):
+
+    loc, scale = standard_scale_fit(data, ddof)
+
+    return scale_transform(data, loc, scale)
+
+
+@jit(nopython=True, cache=True)
+def min_max_scale(data):
+
+    loc, scale = min_max_scale_fit(data)
+
+    return scale_transform(data, loc, scale)
+
+
+@jit(nopython=True, cache=True)
+def nan_standard_scale(data, ddof=0):
+
+    loc, scale = nan_standard_scale_fit(data, ddof)
+
+    return scale_transform(data, loc, scale)
+
+
+@jit(nopython=True, cache=True)
+def nan_min_max_scale(data):
+
+    loc, scale = nan_min_max_scale_fit(data)
+
+    return scale_transform(data, loc, scale)
+
+
+@jit(nopython=True, cache=True)
+def robust_scale(data, lower=25., upper=75.):
+
+    loc, scale = robust_scale_fit(data, lower, upper)
+
+    return scale_transform(data, loc, scale)
+
+
+@jit(nopython=True, parallel=True, error_model='numpy', cache=True)
+def quantile_transform(data):
+    """
+    Map each column onto [0, 1] by its empirical distribution: the
+    average rank of each value, less one, over the number of non-NaN
+    values less one, with the minimum and maximum mapped to exactly 0
+    and 1.  NaNs are kept.  This is scikit-learn's QuantileTransformer
+    with as many quantiles as non-NaN values.
+    """
+    m, n = data.shape
+    res = np.empty((m, n))
+
+    for i in prange(n):
+        column = data[:, i]
+        # NaNs sort last, so the ranks of the other values are unaffected
+        ranks = rank_data(data[:, i:i + 1])[:, 0]
+
+        lowest = np.nanmin(column)
+        highest = np.nanmax(column)
+
+        count = 0
+        for j in range(m):
+            if not np.isnan(column[j]):
+                count += 1
 
-    for i in range(n):
-        data_i = data_t[i, :]
-        res[:, i] = (data_i - np.min(data_i)) / (np.max(data_i) - np.min(data_i))
+        for j in range(m):
+            if np.isnan(column[j]):
+                res[j, i] = np.nan
+            elif column[j] == lowest:
+                res[j, i] = 0.
+            elif column[j] == highest:
+                res[j, i] = 1.
+            else:
+                res[j, i] = (ranks[j] - 1) / (count - 1)
 
     return res
 
@@ -0,0 +1,276 @@
+import math
+
+import numpy as np
+from numba import njit
+
+from utilities.percentile import _as_percentile_array, _unwrap_percentiles
+
+# A t-digest is held in a single float64 array so that it can be saved,
+# sent between processes or memory-mapped like any other numpy buffer:
+#
+#   header | centroid means | centroid weights | buffer values | buffer weights
+#
+# Incoming values are appended to the buffer, which is merged into the
+# centroids whenever it fills up (and before any query).
+
+_COMPRESSION = 0
+_CENTROID_CAPACITY = 1
+_N_CENTROIDS = 2
+_BUFFER_CAPACITY = 3
+_N_BUFFERED = 4
+_TOTAL_WEIGHT = 5
+_MIN = 6
+_MAX = 7
+_HEADER_SIZE = 8
+
+
+@njit(cache=True)
+def tdigest_new(compression=100.):
+    """
+    Empty t-digest with the given compression, delta.  Each centroid is
+    limited to a unit step of the k_1 scale function,
+
+        k(q) = delta / (2 * pi) * arcsin(2 * q - 1),
+
+    so a centroid at quantile q covers a fraction of at most about
+    2 * pi * sqrt(q * (1 - q)) / delta of the data.  Interpolating within
+    a centroid then puts the rank of an estimated percentile within about
+
+        pi * sqrt(q * (1 - q)) / delta
+
+    of the requested one - roughly 1.6% at the median for the default
+    delta of 100, and much less towards the tails.  This is a heuristic
+    rather than a worst-case guarantee: it holds for a digest built from
+    individual values and usually holds after merges, which can lose a
+    little accuracy since centroids are merged as a whole.  At most
+    about delta centroids are kept, whatever the number of values.
+    """
+    if not compression >= 1:
+        raise ValueError('compression must be at least 1')
+
+    centroid_capacity = 2 * int(math.ceil(compression)) + 10
+    buffer_capacity = 5 * centroid_capacity
+
+    state = np.zeros(_HEADER_SIZE + 2 * centroid_capacity + 2 * buffer_capacity)
+    state[_COMPRESSION] = compression
+    state[_CENTROID_CAPACITY] = centroid_capacity
+    state[_BUFFER_CAPACITY] = buffer_capacity
+    state[_MIN] = np.inf
+    state[_MAX] = -np.inf
+
+    return state
+
+
+@njit(cache=True)
+def _regions(state):
+    centroid_capacity = int(state[_CENTROID_CAPACITY])
+    buffer_capacity = int(state[_BUFFER_CAPACITY])
+
+    start = _HEADER_SIZE
+    means = state[start:start + centroid_capacity]
+    start += centroid_capacity
+    weights = state[start:start + centroid_capacity]
+    start += centroid_capacity
+    buffer_values = state[start:start + buffer_capacity]
+    start += buffer_capacity
+    buffer_weights = state[start:start + buffer_capacity]
+
+    return means, weights, buffer_values, buffer_weights
+
+
+@njit(cache=True)
+def _k_to_q(k, compression):
+    return (math.sin(k * 2 * math.pi / compression) + 1) / 2
+
+
+@njit(cache=True)
+def _q_to_k(q, compression):
+    return compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+
+@njit(cache=True)
+def _compress(state):
+    """
+    Merge the buffer into the centroids: everything is sorted by mean and
+    neighbours are combined greedily while the combined centroid stays
+    within one unit of the scale function.
+    """
+    n_centroids = int(state[_N_CENTROIDS])
+    n_buffered = int(state[_N_BUFFERED])
+
+    if n_buffered == 0:
+        return
+
+    means, weights, buffer_values, buffer_weights = _regions(state)
+    compression = state[_COMPRESSION]
+    total = state[_TOTAL_WEIGHT]
+
+    n = n_centroids + n_buffered
+    all_means = np.concatenate((means[:n_centroids], buffer_values[:n_buffered]))
+    all_weights = np.concatenate((weights[:n_centroids], buffer_weights[:n_buffered]))
+    order = np.argsort(all_means, kind='mergesort')
+
+    capacity = means.shape[0]
+    out = 0
+    means[0] = all_means[order[0]]
+    weights[0] = all_weights[order[0]]
+    weight_so_far = 0.
+    q_limit = _k_to_q(_q_to_k(0., compression) + 1, compression)
+
+    for j in range(1, n):
+        mean = all_means[order[j]]
+        weight = all_weights[order[j]]
+
+        if (weight_so_far + weights[out] + weight) / total <= q_limit or out == capacity - 1:
+            weights[out] += weight
+            means[out] += weight * (mean - means[out]) / weights[out]
+        else:
+            weight_so_far += weights[out]
+            q_limit = _k_to_q(_q_to_k(min(weight_so_far / total, 1.), compression) + 1, compression)
+            out += 1
+            means[out] = mean
+            weights[out] = weight
+
+    state[_N_CENTROIDS] = out + 1
+    state[_N_BUFFERED] = 0
+
+
+@njit(cache=True)
+def _add_weighted(state, value, weight):
+    if int(state[_N_BUFFERED]) == int(state[_BUFFER_CAPACITY]):
+        _compress(state)
+
+    _, _, buffer_values, buffer_weights = _regions(state)
+    n_buffered = int(state[_N_BUFFERED])
+    buffer_values[n_buffered] = value
+    buffer_weights[n_buffered] = weight
+
+    state[_N_BUFFERED] = n_buffered + 1
+    state[_TOTAL_WEIGHT] += weight
+
+
+@njit(cache=True)
+def tdigest_update(state, values):
+    """
+    Add values to the digest in place.  NaNs are ignored.
+    """
+    for v in values.ravel():
+        if np.isnan(v):
+            continue
+
+        _add_weighted(state, v, 1.)
+        state[_MIN] = min(state[_MIN], v)
+        state[_MAX] = max(state[_MAX], v)
+
+
+@njit(cache=True)
+def tdigest_merge(a, b):
+    """
+    New digest summarising the values of both a and b, with the
+    compression of a.  Merging is associative up to the approximation,
+    so digests can be built per chunk or per process and then combined.
+    Neither a nor b is modified, so either may be read-only.
+    """
+    state = a.copy()
+
+    # the buffered values of b are added as they are, rather than merged
+    # into its centroids first, which would write to b
+    means, weights, buffer_values, buffer_weights = _regions(b)
+
+    for i in range(int(b[_N_CENTROIDS])):
+        _add_weighted(state, means[i], weights[i])
+
+    for i in range(int(b[_N_BUFFERED])):
+        _add_weighted(state, buffer_values[i], buffer_weights[i])
+
+    state[_MIN] = min(a[_MIN], b[_MIN])
+    state[_MAX] = max(a[_MAX], b[_MAX])
+
+    _compress(state)
+
+    return state
+
+
+@njit(cache=True)
+def tdigest_count(state):
+    return state[_TOTAL_WEIGHT]
+
+
+@njit(cache=True)
+def _tdigest_value(state, percentile):
+    means, weights, _, _ = _regions(state)
+    n = int(state[_N_CENTROIDS])
+    total = state[_TOTAL_WEIGHT]
+    min_value = state[_MIN]
+    max_value = state[_MAX]
+
+    if n == 0:
+        return np.nan
+
+    if percentile == 0:
+        return min_value
+
+    if percentile == 100:
+        return max_value
+
+    if n == 1:
+        return means[0]
+
+    index = total * percentile / 100
+
+    # between the minimum and the centre of the first centroid
+    half_weight = weights[0] / 2
+    if index < half_weight:
+        return min_value + (index / half_weight) * (means[0] - min_value)
+
+    cumulative = half_weight
+    for i in range(n - 1):
+        step = (weights[i] + weights[i + 1]) / 2
+        if cumulative + step > index:
+            fraction = (index - cumulative) / step
+            return means[i] + fraction * (means[i + 1] - means[i])
+        cumulative += step
+
+    # between the centre of the last centroid and the maximum
+    half_weight = weights[n - 1] / 2
+    fraction = min((index - cumulative) / half_weight, 1.)
+    return means[n - 1] + fraction * (max_value - means[n - 1])
+
+
+@njit(cache=True)
+def _tdigest_values(state, qs):
+    out = np.empty(len(qs))
+
+    for i in range(len(qs)):
+        out[i] = _tdigest_value(state, qs[i])
+
+    return out
+
+
+@njit(cache=True)
+def tdigest_percentile(state, q):
+    """
+    Estimated percentile(s) of the values added to the digest, with q in
+    [0, 100] as for np.percentile.  Any buffered values are merged into a
+    copy of the digest first, so the state is never modified and may be
+    read-only (memory-mapped, say).
+    """
+    qs = _as_percentile_array(q)
+
+    for percentile in qs:
+        if percentile < 0 or percentile > 100 or np.isnan(percentile):
+            raise ValueError("Percentiles must be in the range [0,100]")
+
+    if int(state[_N_BUFFERED]) == 0:
+        out = _tdigest_values(state, qs)
+    else:
+        flushed = state.copy()
+        _compress(flushed)
+        out = _tdigest_values(flushed, qs)
+
+    return _unwrap_percentiles(out, q)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -1,8 +1,8 @@
 import numpy as np
-from numba import njit
+from numba import njit, prange, get_num_threads
 
 
-@njit
+@njit(cache=True)
 def rank_data(A):
     """
     Rank supplied data column-wise.  Ties are dealt with using
@@ -41,3 +41,216 @@ def rank_data(A):
         res[:, i] = (count[dense] + count[dense - 1] + 1) / 2.0
 
     return res
+
+
+@njit(cache=True)
+def _less(a, b):
+    # ascending order with NaNs last
+    return a < b or (b != b and a == a)
+
+
+@njit(cache=True)
+def _argsort_into(values, order, scratch):
+    """
+    Stable bottom-up merge sort of the indices of values into order,
+    using scratch (of the same length) rather than allocating.
+    """
+    m = values.shape[0]
+    for i in range(m):
+        order[i] = i
+
+    src = order
+    dst = scratch
+    width = 1
+    while width < m:
+        for lo in range(0, m, 2 * width):
+            mid = min(lo + width, m)
+            hi = min(lo + 2 * width, m)
+            i = lo
+            j = mid
+            for k in range(lo, hi):
+                if j >= hi or (i < mid and not _less(values[src[j]], values[src[i]])):
+                    dst[k] = src[i]
+                    i += 1
+                else:
+                    dst[k] = src[j]
+                    j += 1
+        src, dst = dst, src
+        width *= 2
+
+    if src is not order:
+        order[:] = src
+
+
+@njit(cache=True)
+def _rank_average(values, order, out):
+    # one pass over the sorted values, giving each run of ties its average rank
+    m = values.shape[0]
+    j = 0
+    while j < m:
+        v = values[order[j]]
+        k = j + 1
+        while k < m and values[order[k]] == v:
+            k += 1
+
+        rank = (j + k + 1) / 2.0
+        for t in range(j, k):
+            out[order[t]] = rank
+        j = k
+
+
+@njit(parallel=True, cache=True)
+def _rank_data_parallel(A, n_blocks):
+
+    m, n = A.shape
+    res = np.empty((m, n))
+
+    for b in prange(n_blocks):
+        order = np.empty(m, dtype=np.intp)
+        scratch = np.empty(m, dtype=np.intp)
+        ranks = np.empty(m)
+
+        for i in range(b, n, n_blocks):
+            _argsort_into(A[:, i], order, scratch)
+            _rank_average(A[:, i], order, ranks)
+            res[:, i] = ranks
+
+    return res
+
+
+def rank_data_parallel(A):
+    """
+    As rank_data, with the columns split into one block per thread.  Each
+    thread sorts into scratch buffers allocated once, and the input is
+    compared in its own dtype, so there is no float64 copy (and no
+    spurious ties from one).
+    """
+    assert A.ndim > 1
+
+    return _rank_data_parallel(A, max(min(get_num_threads(), A.shape[1]), 1))
+
+
+_AVERAGE, _MIN, _MAX, _DENSE, _ORDINAL = range(5)
+_METHODS = {'average': _AVERAGE, 'min': _MIN, 'max': _MAX, 'dense': _DENSE, 'ordinal': _ORDINAL}
+
+_KEEP, _TOP, _BOTTOM = range(3)
+_NA_OPTIONS = {'keep': _KEEP, 'top': _TOP, 'bottom': _BOTTOM}
+
+
+@njit(cache=True)
+def _assign_run(order, start, stop, offset, dense_rank, method, out):
+    # rank the tied values order[start:stop], which occupy sorted positions
+    # start + offset to stop + offset
+    lo = start + offset
+    hi = stop + offset
+
+    for t in range(start, stop):
+        if method == _AVERAGE:
+            out[order[t]] = (lo + hi + 1) / 2.0
+        elif method == _MIN:
+            out[order[t]] = lo + 1
+        elif method == _MAX:
+            out[order[t]] = hi
+        elif method == _DENSE:
+            out[order[t]] = dense_rank
+        else:
+            out[order[t]] = t + offset + 1
+
+
+@njit(error_model='numpy', cache=True)
+def _rank_lane(values, order, scratch, method, na_option, pct, out):
+    """
+    Rank one lane with one sort and one pass over the runs of ties.  NaNs
+    sort last, and are then either kept as NaN or ranked as a single tie
+    before or after all the other values.
+    """
+    _argsort_into(values, order, scratch)
+
+    m = values.shape[0]
+    n_valid = m
+    while n_valid > 0 and values[order[n_valid - 1]] != values[order[n_valid - 1]]:
+        n_valid -= 1
+    n_nan = m - n_valid
+
+    nans_first = na_option == _TOP and n_nan > 0
+    offset = n_nan if nans_first else 0
+    dense_rank = 1 if nans_first else 0
+
+    j = 0
+    while j < n_valid:
+        v = values[order[j]]
+        k = j + 1
+        while k < n_valid and values[order[k]] == v:
+            k += 1
+
+        dense_rank += 1
+        _assign_run(order, j, k, offset, dense_rank, method, out)
+        j = k
+
+    n_groups = dense_rank
+    if n_nan > 0:
+        if na_option == _KEEP:
+            for t in range(n_valid, m):
+                out[order[t]] = np.nan
+        elif na_option == _TOP:
+            _assign_run(order, n_valid, m, -n_valid, 1, method, out)
+        else:
+            n_groups += 1
+            _assign_run(order, n_valid, m, 0, n_groups, method, out)
+
+    if pct:
+        if method == _DENSE:
+            divisor = n_groups
+        elif na_option == _KEEP:
+            divisor = n_valid
+        else:
+            divisor = m
+
+        for i in range(m):
+            out[i] /= divisor
+
+
+@njit(parallel=True, cache=True)
+def _rank_columns(A, method, na_option, pct, out, n_blocks):
+
+    m, n = A.shape
+
+    for b in prange(n_blocks):
+        order = np.empty(m, dtype=np.intp)
+        scratch = np.empty(m, dtype=np.intp)
+
+        for i in range(b, n, n_blocks):
+            _rank_lane(A[:, i], order, scratch, method, na_option, pct, out[:, i])
+
+
+def rank_along_axis(A, axis=0, method='average', na_option='keep', pct=False):
+    """
+    Rank the columns (axis=0) or rows (axis=1) of A in parallel, with the
+    tie methods of scipy.stats.rankdata and the na_option and pct options
+    of pandas' rank.  1-D input is ranked as a whole.
+    """
+    if method not in _METHODS:
+        raise ValueError('method must be one of ' + ', '.join(_METHODS))
+
+    if na_option not in _NA_OPTIONS:
+        raise ValueError('na_option must be one of ' + ', '.join(_NA_OPTIONS))
+
+    A = np.asarray(A)
+    res = np.empty(A.shape)
+    n_threads = get_num_threads()
+
+    if A.ndim == 1:
+        _rank_columns(A[:, None], _METHODS[method], _NA_OPTIONS[na_option], pct, res[:, None], 1)
+    elif A.ndim != 2:
+        raise ValueError('A must be 1 or 2 dimensional')
+    elif axis == 0:
+        n_blocks = max(min(n_threads, A.shape[1]), 1)
+        _rank_columns(A, _METHODS[method], _NA_OPTIONS[na_option], pct, res, n_blocks)
+    elif axis == 1:
+        # the transposed views make each row of a C-ordered array a contiguous column
+        n_blocks = max(min(n_threads, A.shape[0]), 1)
+        _rank_columns(A.T, _METHODS[method], _NA_OPTIONS[na_option], pct, res.T, n_blocks)
+    else:
+        raise ValueError('axis must be either 0 or 1')
+
+    return res
@@ -1,10 +1,19 @@
+import types
+
 import numpy as np
 
-from numba import jit
+from numba import jit, prange, float64, int64
+from numba.experimental import jitclass
+
+from utilities.percentile import _linear_rank
 
 
-@jit(nopython=True)
-def _rolling_statistic(x, window, window_divisor):
+# The appliers below are templates calling a global _kernel, and each
+# kernel gets its own jitted copy, from _rolling_appliers.  A kernel passed
+# as an argument or closed over is only identified within the process, so
+# numba couldn't cache the appliers on disk, whereas a global is compiled
+# in as a constant.
+def _rolling_apply(x, window, param):
 
     if window < 0:
         raise ValueError('window must be non-negative')
@@ -14,10 +23,136 @@ def _rolling_statistic(x, window, window_divisor):
     if window == 0:
         return np.full(n, np.nan)
 
-    if window == 1:
-        return x
+    res = np.empty(n)
+    _kernel(x, window, param, res)
+
+    return res
+
+
+def _rolling_apply_2d(x, window, param):
+    """
+    Apply a rolling kernel to each column of a 2-D array,
+    with the columns distributed across threads.
+    """
+    if window < 0:
+        raise ValueError('window must be non-negative')
+
+    n, m = x.shape
+
+    if window == 0:
+        return np.full((n, m), np.nan)
+
+    res = np.empty((n, m))
+
+    for j in prange(m):
+        _kernel(x[:, j], window, param, res[:, j])
+
+    return res
+
+
+def _rolling_pair_apply(x, y, window, param):
+
+    if window < 0:
+        raise ValueError('window must be non-negative')
+
+    n = x.shape[0]
+
+    if window == 0:
+        return np.full(n, np.nan)
 
     res = np.empty(n)
+    _kernel(x, y, window, param, res)
+
+    return res
+
+
+def _rolling_pair_apply_2d(x, y, window, param):
+    """
+    Apply a rolling kernel to each pair of corresponding columns of
+    two 2-D arrays, with the pairs distributed across threads.
+    """
+    if window < 0:
+        raise ValueError('window must be non-negative')
+
+    n, m = x.shape
+
+    if window == 0:
+        return np.full((n, m), np.nan)
+
+    res = np.empty((n, m))
+
+    for j in prange(m):
+        _kernel(x[:, j], y[:, j], window, param, res[:, j])
+
+    return res
+
+
+def _specialise(template, kernel, name, parallel=False):
+    # a cached copy of template calling kernel, under its own name so that
+    # each copy has its own cache entries
+    func = types.FunctionType(template.__code__, dict(template.__globals__, _kernel=kernel), name)
+    func.__qualname__ = name
+    func.__doc__ = template.__doc__
+
+    return jit(nopython=True, parallel=parallel, cache=True)(func)
+
+
+def _rolling_appliers(kernel, name):
+    return _specialise(_rolling_apply, kernel, name), _specialise(_rolling_apply_2d, kernel, name + '_2d', True)
+
+
+def _rolling_pair_appliers(kernel, name):
+    return (_specialise(_rolling_pair_apply, kernel, name),
+            _specialise(_rolling_pair_apply_2d, kernel, name + '_2d', True))
+
+
+def _apply_rolling(appliers, x, window, param, axis):
+
+    apply_1d, apply_2d = appliers
+
+    if x.ndim == 1:
+        return apply_1d(x, window, param)
+
+    if x.ndim != 2:
+        raise ValueError('x must be either 1 or 2 dimensional')
+
+    if axis == 0:
+        return apply_2d(x, window, param)
+    elif axis == 1:
+        return apply_2d(x.T, window, param).T
+    else:
+        raise ValueError('axis must be either 0 or 1')
+
+
+def _apply_rolling_pair(appliers, x, y, window, param, axis):
+
+    apply_1d, apply_2d = appliers
+
+    if x.shape != y.shape:
+        raise ValueError('x and y must have the same shape')
+
+    if x.ndim == 1:
+        return apply_1d(x, y, window, param)
+
+    if x.ndim != 2:
+        raise ValueError('x and y must be either 1 or 2 dimensional')
+
+    if axis == 0:
+        return apply_2d(x, y, window, param)
+    elif axis == 1:
+        return apply_2d(x.T, y.T, window, param).T
+    else:
+        raise ValueError('axis must be either 0 or 1')
+
+
+@jit(nopython=True, cache=True)
+def _rolling_statistic_kernel(x, window, window_divisor, res):
+
+    n = x.shape[0]
+
+    if window == 1:
+        res[:] = x
+        return
 
     _sum = 0
     nans_in_window = 0
@@ -27,7 +162,7 @@ def _rolling_statistic(x, window, window_divisor):
         _nan_arrived = np.isnan(data_i)
 
         if _nan_arrived:
-            nans_in_window = min(window, nans_in_window + 1)
+            nans_in_window += 1
         else:
             _sum += data_i
 
@@ -42,11 +177,9 @@ def _rolling_statistic(x, window, window_divisor):
 
         if i >= window:
             evict_i = x[i - window]
-            _evict_nan = np.isnan(evict_i)
 
-            if _evict_nan:
-                if not _nan_arrived:
-                    nans_in_window -= 1
+            if np.isnan(evict_i):
+                nans_in_window -= 1
             else:
                 _sum -= evict_i
 
@@ -56,15 +189,908 @@ def _rolling_statistic(x, window, window_divisor):
 
         res[i] = np.nan
 
+
+_ROLLING_STATISTIC = _rolling_appliers(_rolling_statistic_kernel, '_rolling_statistic')
+
+
+def rolling_sum(x, window, axis=0):
+    return _apply_rolling(_ROLLING_STATISTIC, x, window, 1, axis)
+
+
+def rolling_mean(x, window, axis=0):
+    return _apply_rolling(_ROLLING_STATISTIC, x, window, window, axis)
+
+
+@jit(nopython=True, cache=True)
+def _kahan_add(total, compensation, value):
+    y = value - compensation
+    t = total + y
+    return t, (t - total) - y
+
+
+@jit(nopython=True, cache=True)
+def _rolling_var_kernel(x, window, ddof, res):
+    """
+    Welford's online algorithm, extended to evict values as they leave
+    the window, with Kahan compensation on the running mean.
+    """
+    n = x.shape[0]
+
+    nobs = 0
+    mean_x = 0.
+    compensation = 0.
+    ssqdm_x = 0.
+    nans_in_window = 0
+
+    # an exactly constant window must produce a variance of exactly zero
+    prev_value = np.nan
+    num_consecutive_same_value = 0
+
+    for i in range(n):
+
+        if i >= window:
+            evict_i = x[i - window]
+
+            if np.isnan(evict_i):
+                nans_in_window -= 1
+            else:
+                nobs -= 1
+                if nobs == 0:
+                    mean_x = 0.
+                    compensation = 0.
+                    ssqdm_x = 0.
+                else:
+                    delta = evict_i - mean_x
+                    mean_x, compensation = _kahan_add(mean_x, compensation, -delta / nobs)
+                    ssqdm_x -= delta * (evict_i - mean_x)
+
+        data_i = x[i]
+
+        if np.isnan(data_i):
+            nans_in_window += 1
+        else:
+            nobs += 1
+            delta = data_i - mean_x
+            mean_x, compensation = _kahan_add(mean_x, compensation, delta / nobs)
+            ssqdm_x += delta * (data_i - mean_x)
+
+            if data_i == prev_value:
+                num_consecutive_same_value += 1
+            else:
+                num_consecutive_same_value = 1
+            prev_value = data_i
+
+        if i < window - 1 or nans_in_window > 0 or nobs <= ddof:
+            res[i] = np.nan
+        elif nobs == 1 or num_consecutive_same_value >= nobs:
+            res[i] = 0.
+        else:
+            res[i] = max(ssqdm_x / (nobs - ddof), 0.)
+
+
+@jit(nopython=True, cache=True)
+def _rolling_moment_kernel(x, window, moment, res):
+    """
+    Rolling skew (moment 3) or excess kurtosis (moment 4) from
+    Kahan-compensated power sums of the values, centred on their mean
+    beforehand to limit cancellation.  The bias correction and the
+    treatment of (near-)constant windows follow pandas.
+    """
+    n = x.shape[0]
+
+    centre = 0.
+    count = 0
+    for i in range(n):
+        if not np.isnan(x[i]):
+            centre += x[i]
+            count += 1
+    if count > 0:
+        centre /= count
+
+    s1 = s2 = s3 = s4 = 0.
+    c1 = c2 = c3 = c4 = 0.
+    nobs = 0
+    nans_in_window = 0
+
+    prev_value = np.nan
+    num_consecutive_same_value = 0
+
+    for i in range(n):
+
+        if i >= window:
+            evict_i = x[i - window]
+
+            if np.isnan(evict_i):
+                nans_in_window -= 1
+            else:
+                nobs -= 1
+                v = evict_i - centre
+                v2 = v * v
+                s1, c1 = _kahan_add(s1, c1, -v)
+                s2, c2 = _kahan_add(s2, c2, -v2)
+                s3, c3 = _kahan_add(s3, c3, -v2 * v)
+                s4, c4 = _kahan_add(s4, c4, -v2 * v2)
+
+        data_i = x[i]
+
+        if np.isnan(data_i):
+            nans_in_window += 1
+        else:
+            nobs += 1
+            v = data_i - centre
+            v2 = v * v
+            s1, c1 = _kahan_add(s1, c1, v)
+            s2, c2 = _kahan_add(s2, c2, v2)
+            s3, c3 = _kahan_add(s3, c3, v2 * v)
+            s4, c4 = _kahan_add(s4, c4, v2 * v2)
+
+            if data_i == prev_value:
+                num_consecutive_same_value += 1
+            else:
+                num_consecutive_same_value = 1
+            prev_value = data_i
+
+        if i < window - 1 or nans_in_window > 0 or nobs < moment:
+            res[i] = np.nan
+            continue
+
+        dnobs = float(nobs)
+        a = s1 / dnobs
+        b = s2 / dnobs - a * a
+        c = s3 / dnobs - a * a * a - 3 * a * b
+
+        if num_consecutive_same_value >= nobs:
+            res[i] = 0. if moment == 3 else -3.
+        elif b <= 1e-14:
+            res[i] = np.nan
+        elif moment == 3:
+            r = np.sqrt(b)
+            res[i] = (np.sqrt(dnobs * (dnobs - 1.)) * c) / ((dnobs - 2) * r * r * r)
+        else:
+            d = s4 / dnobs - a * a * a * a - 6 * b * a * a - 4 * c * a
+            k = (dnobs * dnobs - 1.) * d / (b * b) - 3 * ((dnobs - 1.) ** 2)
+            res[i] = k / ((dnobs - 2.) * (dnobs - 3.))
+
+
+_ROLLING_VAR = _rolling_appliers(_rolling_var_kernel, '_rolling_var')
+
+
+def rolling_var(x, window, ddof=1, axis=0):
+    return _apply_rolling(_ROLLING_VAR, x, window, ddof, axis)
+
+
+def rolling_std(x, window, ddof=1, axis=0):
+    return np.sqrt(rolling_var(x, window, ddof, axis))
+
+
+_ROLLING_MOMENT = _rolling_appliers(_rolling_moment_kernel, '_rolling_moment')
+
+
+def rolling_skew(x, window, axis=0):
+    return _apply_rolling(_ROLLING_MOMENT, x, window, 3, axis)
+
+
+def rolling_kurt(x, window, axis=0):
+    return _apply_rolling(_ROLLING_MOMENT, x, window, 4, axis)
+
+
+@jit(nopython=True, cache=True)
+def _fenwick_add(tree, position, value):
+    i = position + 1
+    while i < tree.shape[0]:
+        tree[i] += value
+        i += i & -i
+
+
+@jit(nopython=True, cache=True)
+def _fenwick_kth(tree, k):
+    """
+    Position of the (zero-based) k-th smallest element held in the tree.
+    """
+    size = tree.shape[0] - 1
+
+    step = 1
+    while step * 2 <= size:
+        step *= 2
+
+    position = 0
+    while step > 0:
+        if position + step <= size and tree[position + step] <= k:
+            position += step
+            k -= tree[position]
+        step //= 2
+
+    return position
+
+
+@jit(nopython=True, cache=True)
+def _fenwick_prefix(tree, position):
+    """
+    Total held in the tree at positions before position.
+    """
+    total = 0
+    i = position
+    while i > 0:
+        total += tree[i]
+        i -= i & -i
+
+    return total
+
+
+@jit(nopython=True, cache=True)
+def _rolling_quantile_kernel(x, window, quantile, res):
+    """
+    The values are ranked once over the whole series, and the window is
+    held as a Fenwick tree of counts over those ranks, so that adding,
+    evicting and selecting an order statistic are each O(log n).
+    NaNs are ignored within the window, as in np.nanpercentile.
+    """
+    n = x.shape[0]
+
+    order = np.argsort(x)
+    sorted_x = x[order]
+    ranks = np.empty(n, dtype=np.int64)
+    for j in range(n):
+        ranks[order[j]] = j
+
+    tree = np.zeros(n + 1, dtype=np.int64)
+    count = 0
+
+    for i in range(n):
+        if not np.isnan(x[i]):
+            _fenwick_add(tree, ranks[i], 1)
+            count += 1
+
+        if i >= window and not np.isnan(x[i - window]):
+            _fenwick_add(tree, ranks[i - window], -1)
+            count -= 1
+
+        if i < window - 1 or count == 0:
+            res[i] = np.nan
+            continue
+
+        f, m = _linear_rank(count, 100 * quantile)
+        prior_val = sorted_x[_fenwick_kth(tree, f)]
+
+        if m > 0:
+            res[i] = prior_val + m * (sorted_x[_fenwick_kth(tree, f + 1)] - prior_val)
+        else:
+            res[i] = prior_val
+
+
+_ROLLING_QUANTILE = _rolling_appliers(_rolling_quantile_kernel, '_rolling_quantile')
+
+
+def rolling_quantile(x, window, quantile, axis=0):
+
+    if not 0 <= quantile <= 1:
+        raise ValueError('quantile must be in the range [0,1]')
+
+    return _apply_rolling(_ROLLING_QUANTILE, x, window, quantile, axis)
+
+
+def rolling_median(x, window, axis=0):
+    return rolling_quantile(x, window, 0.5, axis)
+
+
+@jit(nopython=True, cache=True)
+def _rolling_rank_kernel(x, window, pct, res):
+    """
+    Rank of each value within its window, with ties given their average
+    rank as in rank_data.  Equal values share a key over the whole series,
+    and the window is held as a Fenwick tree of counts over the keys, so
+    that each step is O(log n).
+    """
+    n = x.shape[0]
+
+    order = np.argsort(x)
+    keys = np.empty(n, dtype=np.int64)
+    key = 0
+    for j in range(n):
+        if j > 0 and x[order[j]] != x[order[j - 1]]:
+            key += 1
+        keys[order[j]] = key
+
+    tree = np.zeros(n + 1, dtype=np.int64)
+    nans_in_window = 0
+
+    for i in range(n):
+        if np.isnan(x[i]):
+            nans_in_window += 1
+        else:
+            _fenwick_add(tree, keys[i], 1)
+
+        if i >= window:
+            if np.isnan(x[i - window]):
+                nans_in_window -= 1
+            else:
+                _fenwick_add(tree, keys[i - window], -1)
+
+        if i < window - 1 or nans_in_window > 0:
+            res[i] = np.nan
+            continue
+
+        less = _fenwick_prefix(tree, keys[i])
+        equal = _fenwick_prefix(tree, keys[i] + 1) - less
+        rank = less + (equal + 1) / 2.
+
+        res[i] = rank / window if pct else rank
+
+
+_ROLLING_RANK = _rolling_appliers(_rolling_rank_kernel, '_rolling_rank')
+
+
+def rolling_rank(x, window, pct=False, axis=0):
+    return _apply_rolling(_ROLLING_RANK, x, window, pct, axis)
+
+
+@jit(nopython=True, cache=True)
+def _is_pair_valid(x, y, i):
+    return not (np.isnan(x[i]) or np.isnan(y[i]))
+
+
+@jit(nopython=True, cache=True)
+def _rank_shift(existing, value):
+    # change in the average rank of an existing value when value joins it
+    if existing > value:
+        return 1.
+    elif existing == value:
+        return 0.5
+    return 0.
+
+
+@jit(nopython=True, cache=True)
+def _rolling_spearman_kernel(x, y, window, param, res):
+    """
+    The average ranks of the window values are held in ring buffers.  A
+    value joining or leaving the window shifts the ranks of the values
+    above it by one (or a half, for ties), so each step is O(window).
+    """
+    n = x.shape[0]
+
+    rank_x = np.zeros(window)
+    rank_y = np.zeros(window)
+    invalid_in_window = 0
+    mean_rank = (window + 1) / 2.
+
+    for i in range(n):
+
+        if i >= window:
+            k = i - window
+
+            if _is_pair_valid(x, y, k):
+                for j in range(k + 1, i):
+                    if _is_pair_valid(x, y, j):
+                        rank_x[j % window] -= _rank_shift(x[j], x[k])
+                        rank_y[j % window] -= _rank_shift(y[j], y[k])
+            else:
+                invalid_in_window -= 1
+
+        if _is_pair_valid(x, y, i):
+            new_rank_x = 1.
+            new_rank_y = 1.
+            for j in range(max(i - window + 1, 0), i):
+                if _is_pair_valid(x, y, j):
+                    shift_x = _rank_shift(x[j], x[i])
+                    shift_y = _rank_shift(y[j], y[i])
+                    rank_x[j % window] += shift_x
+                    rank_y[j % window] += shift_y
+                    new_rank_x += 1. - shift_x
+                    new_rank_y += 1. - shift_y
+
+            rank_x[i % window] = new_rank_x
+            rank_y[i % window] = new_rank_y
+        else:
+            invalid_in_window += 1
+
+        if i < window - 1 or invalid_in_window > 0:
+            res[i] = np.nan
+            continue
+
+        sxx = 0.
+        syy = 0.
+        sxy = 0.
+        for j in range(window):
+            dx = rank_x[j] - mean_rank
+            dy = rank_y[j] - mean_rank
+            sxx += dx * dx
+            syy += dy * dy
+            sxy += dx * dy
+
+        if sxx == 0 or syy == 0:
+            res[i] = np.nan
+        else:
+            res[i] = sxy / np.sqrt(sxx * syy)
+
+
+_ROLLING_SPEARMAN = _rolling_pair_appliers(_rolling_spearman_kernel, '_rolling_spearman')
+
+
+def rolling_spearman(x, y, window, axis=0):
+    return _apply_rolling_pair(_ROLLING_SPEARMAN, x, y, window, 0, axis)
+
+
+@jit(nopython=True, cache=True)
+def _compare(a, b):
+    if a > b:
+        return 1
+    elif a < b:
+        return -1
+    return 0
+
+
+@jit(nopython=True, cache=True)
+def _rolling_kendall_kernel(x, y, window, param, res):
+    """
+    Kendall's tau-b, as scipy.stats.kendalltau.  The difference between
+    the numbers of concordant and discordant pairs, and the numbers of
+    pairs tied in x and in y, are updated as each value joins and leaves
+    the window, so each step is O(window).
+    """
+    n = x.shape[0]
+
+    concordance = 0
+    x_ties = 0
+    y_ties = 0
+    invalid_in_window = 0
+    n_pairs = window * (window - 1) // 2
+
+    for i in range(n):
+
+        if i >= window:
+            k = i - window
+
+            if _is_pair_valid(x, y, k):
+                for j in range(k + 1, i):
+                    if _is_pair_valid(x, y, j):
+                        cx = _compare(x[j], x[k])
+                        cy = _compare(y[j], y[k])
+                        concordance -= cx * cy
+                        x_ties -= cx == 0
+                        y_ties -= cy == 0
+            else:
+                invalid_in_window -= 1
+
+        if _is_pair_valid(x, y, i):
+            for j in range(max(i - window + 1, 0), i):
+                if _is_pair_valid(x, y, j):
+                    cx = _compare(x[j], x[i])
+                    cy = _compare(y[j], y[i])
+                    concordance += cx * cy
+                    x_ties += cx == 0
+                    y_ties += cy == 0
+        else:
+            invalid_in_window += 1
+
+        if i < window - 1 or invalid_in_window > 0:
+            res[i] = np.nan
+            continue
+
+        denominator = float(n_pairs - x_ties) * float(n_pairs - y_ties)
+        if denominator <= 0:
+            res[i] = np.nan
+        else:
+            res[i] = concordance / np.sqrt(denominator)
+
+
+_ROLLING_KENDALL = _rolling_pair_appliers(_rolling_kendall_kernel, '_rolling_kendall')
+
+
+def rolling_kendall(x, y, window, axis=0):
+    return _apply_rolling_pair(_ROLLING_KENDALL, x, y, window, 0, axis)
+
+
+_MIN, _MAX, _ARGMIN, _ARGMAX = range(4)
+
+
+@jit(nopython=True, cache=True)
+def _rolling_extreme_kernel(x, window, statistic, res):
+    """
+    Monotonic deque of the indices of the window values that could still
+    become its minimum (or maximum), held as a ring buffer of window
+    slots, so that each value is pushed and popped at most once.  Equal
+    values do not displace earlier ones, so an arg statistic gives the
+    first position of the extreme within the window, as np.argmax does.
+    """
+    n = x.shape[0]
+
+    deque = np.empty(window, dtype=np.int64)
+    head = 0
+    size = 0
+    nans_in_window = 0
+    is_min = statistic == _MIN or statistic == _ARGMIN
+
+    for i in range(n):
+
+        if i >= window and np.isnan(x[i - window]):
+            nans_in_window -= 1
+
+        if size > 0 and deque[head] <= i - window:
+            head = (head + 1) % window
+            size -= 1
+
+        data_i = x[i]
+
+        if np.isnan(data_i):
+            nans_in_window += 1
+        else:
+            while size > 0:
+                back = x[deque[(head + size - 1) % window]]
+                if (is_min and back > data_i) or (not is_min and back < data_i):
+                    size -= 1
+                else:
+                    break
+            deque[(head + size) % window] = i
+            size += 1
+
+        if i < window - 1 or nans_in_window > 0:
+            res[i] = np.nan
+            continue
+
+        front = deque[head]
+        if statistic == _MIN or statistic == _MAX:
+            res[i] = x[front]
+        else:
+            res[i] = front - (i - window + 1)
+
+
+_ROLLING_EXTREME = _rolling_appliers(_rolling_extreme_kernel, '_rolling_extreme')
+
+
+def rolling_min(x, window, axis=0):
+    return _apply_rolling(_ROLLING_EXTREME, x, window, _MIN, axis)
+
+
+def rolling_max(x, window, axis=0):
+    return _apply_rolling(_ROLLING_EXTREME, x, window, _MAX, axis)
+
+
+def rolling_argmin(x, window, axis=0):
+    return _apply_rolling(_ROLLING_EXTREME, x, window, _ARGMIN, axis)
+
+
+def rolling_argmax(x, window, axis=0):
+    """
+    Position of the maximum within each window, from 0 for its oldest
+    value to window - 1 for the latest.
+    """
+    return _apply_rolling(_ROLLING_EXTREME, x, window, _ARGMAX, axis)
+
+
+def rolling_drawdown(x, window, axis=0):
+    """
+    Fractional fall of each value from the highest value in its window,
+    x / rolling_max(x) - 1, for a series of prices or wealth.
+    """
+    return x / rolling_max(x, window, axis) - 1
+
+
+_COV, _CORR, _BETA = range(3)
+
+
+@jit(nopython=True, cache=True)
+def _rolling_comoment_kernel(x, y, window, statistic, res):
+    """
+    Welford's co-moment update, with values evicted as they leave the
+    window as in _rolling_var_kernel.  A window in which either series
+    has a NaN gives NaN.  statistic is the covariance (with ddof 1, as
+    pandas), the correlation, or the beta of y on x: cov(x, y) / var(x).
+    """
+    n = x.shape[0]
+
+    nobs = 0
+    mean_x = 0.
+    mean_y = 0.
+    ssqdm_x = 0.
+    ssqdm_y = 0.
+    codm = 0.
+    invalid_in_window = 0
+
+    # exactly constant windows must be recognised as having zero variance
+    prev_x = np.nan
+    prev_y = np.nan
+    num_consecutive_same_x = 0
+    num_consecutive_same_y = 0
+
+    for i in range(n):
+
+        if i >= window:
+            k = i - window
+
+            if _is_pair_valid(x, y, k):
+                nobs -= 1
+                if nobs == 0:
+                    mean_x = mean_y = 0.
+                    ssqdm_x = ssqdm_y = codm = 0.
+                else:
+                    delta_x = x[k] - mean_x
+                    delta_y = y[k] - mean_y
+                    mean_x -= delta_x / nobs
+                    mean_y -= delta_y / nobs
+                    ssqdm_x -= delta_x * (x[k] - mean_x)
+                    ssqdm_y -= delta_y * (y[k] - mean_y)
+                    codm -= delta_x * (y[k] - mean_y)
+            else:
+                invalid_in_window -= 1
+
+        if _is_pair_valid(x, y, i):
+            nobs += 1
+            delta_x = x[i] - mean_x
+            delta_y = y[i] - mean_y
+            mean_x += delta_x / nobs
+            mean_y += delta_y / nobs
+            ssqdm_x += delta_x * (x[i] - mean_x)
+            ssqdm_y += delta_y * (y[i] - mean_y)
+            codm += delta_x * (y[i] - mean_y)
+
+            num_consecutive_same_x = num_consecutive_same_x + 1 if x[i] == prev_x else 1
+            num_consecutive_same_y = num_consecutive_same_y + 1 if y[i] == prev_y else 1
+            prev_x = x[i]
+            prev_y = y[i]
+        else:
+            invalid_in_window += 1
+
+        if i < window - 1 or invalid_in_window > 0 or nobs < 2:
+            res[i] = np.nan
+            continue
+
+        constant_x = num_consecutive_same_x >= nobs
+        constant_y = num_consecutive_same_y >= nobs
+
+        if statistic == _COV:
+            res[i] = 0. if (constant_x or constant_y) else codm / (nobs - 1)
+        elif statistic == _CORR:
+            if constant_x or constant_y or ssqdm_x <= 0 or ssqdm_y <= 0:
+                res[i] = np.nan
+            else:
+                res[i] = codm / np.sqrt(ssqdm_x * ssqdm_y)
+        else:
+            if constant_x or ssqdm_x <= 0:
+                res[i] = np.nan
+            else:
+                res[i] = 0. if constant_y else codm / ssqdm_x
+
+
+_ROLLING_COMOMENT = _rolling_pair_appliers(_rolling_comoment_kernel, '_rolling_comoment')
+
+
+def rolling_cov(x, y, window, axis=0):
+    """
+    Rolling covariance of x and y.  Given 2-D arrays of the same shape,
+    each pair of corresponding columns (or rows, with axis=1) is
+    handled in parallel.
+    """
+    return _apply_rolling_pair(_ROLLING_COMOMENT, x, y, window, _COV, axis)
+
+
+def rolling_corr(x, y, window, axis=0):
+    return _apply_rolling_pair(_ROLLING_COMOMENT, x, y, window, _CORR, axis)
+
+
+def rolling_beta(x, y, window, axis=0):
+    """
+    Rolling slope of the regression of y on x (with an intercept).
+    """
+    return _apply_rolling_pair(_ROLLING_COMOMENT, x, y, window, _BETA, axis)
+
+
+@jit(nopython=True, cache=True)
+def _solve_in_place(a, b):
+    """
+    Solve a @ coef = b by Gaussian elimination with partial pivoting,
+    overwriting a and leaving coef in b.  Returns False if a is
+    (numerically) singular.
+    """
+    k = a.shape[0]
+    scale = 0.
+    for r in range(k):
+        scale = max(scale, abs(a[r, r]))
+    tolerance = scale * k * 1e-13
+
+    for c in range(k):
+        pivot = c
+        for r in range(c + 1, k):
+            if abs(a[r, c]) > abs(a[pivot, c]):
+                pivot = r
+
+        if not abs(a[pivot, c]) > tolerance:
+            return False
+
+        if pivot != c:
+            for j in range(k):
+                a[c, j], a[pivot, j] = a[pivot, j], a[c, j]
+            b[c], b[pivot] = b[pivot], b[c]
+
+        for r in range(c + 1, k):
+            factor = a[r, c] / a[c, c]
+            for j in range(c, k):
+                a[r, j] -= factor * a[c, j]
+            b[r] -= factor * b[c]
+
+    for c in range(k - 1, -1, -1):
+        total = b[c]
+        for j in range(c + 1, k):
+            total -= a[c, j] * b[j]
+        b[c] = total / a[c, c]
+
+    return True
+
+
+@jit(nopython=True, cache=True)
+def _is_row_valid(y, X, i):
+    if np.isnan(y[i]):
+        return False
+
+    for p in range(X.shape[1]):
+        if np.isnan(X[i, p]):
+            return False
+
+    return True
+
+
+@jit(nopython=True, cache=True)
+def _rolling_ols_kernel(y, X, window, res):
+    """
+    The cross-product matrices X'X and X'y of the window are updated as
+    each row joins and leaves it, and the normal equations are solved at
+    each step, so each step is O(k ** 3) whatever the window.
+    """
+    n, k = X.shape
+
+    xtx = np.zeros((k, k))
+    xty = np.zeros(k)
+    a = np.empty((k, k))
+    b = np.empty(k)
+    invalid_in_window = 0
+
+    for i in range(n):
+
+        if i >= window:
+            r = i - window
+
+            if _is_row_valid(y, X, r):
+                for p in range(k):
+                    xty[p] -= X[r, p] * y[r]
+                    for q in range(k):
+                        xtx[p, q] -= X[r, p] * X[r, q]
+            else:
+                invalid_in_window -= 1
+
+        if _is_row_valid(y, X, i):
+            for p in range(k):
+                xty[p] += X[i, p] * y[i]
+                for q in range(k):
+                    xtx[p, q] += X[i, p] * X[i, q]
+        else:
+            invalid_in_window += 1
+
+        if i < window - 1 or invalid_in_window > 0:
+            res[i, :] = np.nan
+            continue
+
+        a[:, :] = xtx
+        b[:] = xty
+        if _solve_in_place(a, b):
+            res[i, :] = b
+        else:
+            res[i, :] = np.nan
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _rolling_ols_2d(y, X, window):
+
+    n, m = y.shape
+    res = np.empty((n, m, X.shape[1]))
+
+    for j in prange(m):
+        _rolling_ols_kernel(y[:, j], X, window, res[:, j, :])
+
     return res
 
 
-def rolling_sum(x, window):
-    return _rolling_statistic(x, window, 1)
+def rolling_ols(y, X, window):
+    """
+    Rolling least squares coefficients of y on the columns of X, an
+    (n, k) array which should include a column of ones for an intercept.
+    The result is (n, k), or (n, m, k) for an (n, m) array of m series
+    regressed on the same X in parallel.  Windows with a NaN, or too
+    little variation to determine the coefficients, give NaN.
+    """
+    if window < 0:
+        raise ValueError('window must be non-negative')
+
+    if X.ndim != 2 or X.shape[0] != y.shape[0]:
+        raise ValueError('X must be 2 dimensional, with a row for each value of y')
+
+    if y.ndim not in (1, 2):
+        raise ValueError('y must be either 1 or 2 dimensional')
+
+    y_2d = y[:, None] if y.ndim == 1 else y
+
+    if window == 0:
+        res = np.full(y_2d.shape + (X.shape[1],), np.nan)
+    else:
+        res = _rolling_ols_2d(y_2d, X, window)
+
+    return res[:, 0, :] if y.ndim == 1 else res
+
+
+@jitclass([
+    ('window', int64),
+    ('window_divisor', float64),
+    ('_sum', float64),
+    ('nans_in_window', int64),
+    ('count', int64),
+    ('buffer', float64[:]),
+])
+class RollingAccumulator:
+    """
+    Stateful form of _rolling_statistic_kernel for data which arrives
+    incrementally.  The last window values are kept in a ring buffer
+    so that each pushed value costs O(1), and the output is identical
+    to that of the kernel over the concatenated data.
+    """
+
+    def __init__(self, window, window_divisor):
+        if window < 0:
+            raise ValueError('window must be non-negative')
+
+        self.window = window
+        self.window_divisor = window_divisor
+        self._sum = 0.
+        self.nans_in_window = 0
+        self.count = 0
+        self.buffer = np.empty(max(window, 1))
+
+    def push(self, value):
+        window = self.window
+        i = self.count
+        self.count = i + 1
+
+        if window == 0:
+            return np.nan
+
+        if window == 1:
+            return value
+
+        slot = i % window
+
+        if np.isnan(value):
+            self.nans_in_window += 1
+        else:
+            self._sum += value
+
+        if i >= window:
+            evict_i = self.buffer[slot]
+
+            if np.isnan(evict_i):
+                self.nans_in_window -= 1
+            else:
+                self._sum -= evict_i
+
+        self.buffer[slot] = value
+
+        if i < window - 1 or self.nans_in_window > 0:
+            return np.nan
+
+        return self._sum / self.window_divisor
+
+    def update(self, x):
+        n = x.shape[0]
+        res = np.empty(n)
+
+        for i in range(n):
+            res[i] = self.push(x[i])
+
+        return res
+
+
+def rolling_sum_accumulator(window):
+    return RollingAccumulator(window, 1.)
 
 
-def rolling_mean(x, window):
-    return _rolling_statistic(x, window, window)
+def rolling_mean_accumulator(window):
+    return RollingAccumulator(window, float(window))
 
 
 if __name__ == '__main__':
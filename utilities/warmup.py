@@ -0,0 +1,114 @@
+"""
+Compile the commonly used functions of this package ahead of time.
+
+The jitted functions are declared with cache=True, so calling warmup()
+once (for example when building an image, or with `python -m
+utilities.warmup`) writes their machine code to numba's on-disk cache,
+and later processes load it rather than compiling again.  The time
+taken for each function is reported, so that cold-start regressions
+show up.
+
+np.percentile and np.nanpercentile are overloads, compiled into each
+function which calls them, so only their axis= path, which runs in the
+cached _lane_percentiles, can be compiled ahead of time.
+"""
+import argparse
+import time
+
+import numpy as np
+from numba import njit
+
+import utilities.percentile as perc
+from utilities.ewma import ewma, ewma_2d
+from utilities.percentile import weighted_percentile
+from utilities.preprocessing import standard_scale, min_max_scale, robust_scale
+from utilities.rank_data import rank_data
+from utilities.rolling_stats import rolling_sum, rolling_mean, rolling_var, rolling_std, rolling_median
+
+_ = perc  # registers the np.percentile and np.nanpercentile overloads
+
+DTYPES = ('float64', 'float32', 'int64')
+_FLOATS = ('float64', 'float32')
+
+
+# compiling these compiles _lane_percentiles for the arrays given, which is
+# then loaded from the cache by any function calling np.percentile or
+# np.nanpercentile with axis= on such arrays
+@njit(cache=True)
+def _percentile_axis(a, q):
+    return np.percentile(a, q, axis=0)
+
+
+@njit(cache=True)
+def _nanpercentile_axis(a, q):
+    return np.nanpercentile(a, q, axis=0)
+
+
+def _call_percentile_axis(func, x, X):
+    func(X, 50.)
+    func(X, np.array([5., 50., 95.]))
+
+
+# name, function of a 1-D and a 2-D sample array, dtypes it is compiled for
+_TARGETS = [
+    ('ewma', lambda x, X: ewma(x, 0.1, True, False), _FLOATS),
+    ('ewma_2d', lambda x, X: ewma_2d(X, 0.1, True, False), _FLOATS),
+    ('rolling_sum', lambda x, X: (rolling_sum(x, 3), rolling_sum(X, 3)), _FLOATS),
+    ('rolling_mean', lambda x, X: (rolling_mean(x, 3), rolling_mean(X, 3)), _FLOATS),
+    ('rolling_var', lambda x, X: (rolling_var(x, 3), rolling_var(X, 3)), _FLOATS),
+    ('rolling_std', lambda x, X: (rolling_std(x, 3), rolling_std(X, 3)), _FLOATS),
+    ('rolling_median', lambda x, X: (rolling_median(x, 3), rolling_median(X, 3)), _FLOATS),
+    ('rank_data', lambda x, X: rank_data(X), DTYPES),
+    ('standard_scale', lambda x, X: standard_scale(X), _FLOATS),
+    ('min_max_scale', lambda x, X: min_max_scale(X), _FLOATS),
+    ('robust_scale', lambda x, X: robust_scale(X), _FLOATS),
+    ('weighted_percentile', lambda x, X: weighted_percentile(x, np.ones(len(x)), 50.), DTYPES),
+    ('np.percentile axis', lambda x, X: _call_percentile_axis(_percentile_axis, x, X), DTYPES),
+    ('np.nanpercentile axis', lambda x, X: _call_percentile_axis(_nanpercentile_axis, x, X), DTYPES),
+]
+
+
+def warmup(dtypes=DTYPES, verbose=False):
+    """
+    Compile (or load from the cache) each function for each of the given
+    dtypes that it supports, returning the seconds taken for each as a
+    dict keyed by (name, dtype).
+    """
+    for dtype in dtypes:
+        if dtype not in DTYPES:
+            raise ValueError('dtypes must be among ' + ', '.join(DTYPES))
+
+    timings = {}
+
+    for dtype in dtypes:
+        x = np.arange(10).astype(dtype)
+        X = np.arange(20).reshape(10, 2).astype(dtype)
+
+        for name, func, supported in _TARGETS:
+            if dtype not in supported:
+                continue
+
+            start = time.perf_counter()
+            func(x, X)
+            timings[name, dtype] = time.perf_counter() - start
+
+            if verbose:
+                print('{:<24}{:<10}{:8.3f}s'.format(name, dtype, timings[name, dtype]))
+
+    return timings
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dtypes', nargs='+', default=list(DTYPES), choices=DTYPES)
+    parser.add_argument('--quiet', action='store_true', help='only report the total time')
+    options = parser.parse_args(args)
+
+    timings = warmup(options.dtypes, verbose=not options.quiet)
+    print('{:<34}{:8.3f}s'.format('total', sum(timings.values())))
+
+    return timings
+
+
+if __name__ == '__main__':
+    main()